@@ -7,7 +7,7 @@ from collections import OrderedDict
 
 
 import numpy as np
-import trails.mtmc.ml.deterministic.default as deterministic
+from trails.mtmc.prepared import PreparedMTMC
 
 import sys
 
@@ -45,28 +45,29 @@ hyp_links = csr_matrix(hyp_links / sums)
 transition_counts = csr_matrix((np.ones(transitions.shape[0]), (transitions[:, 0], transitions[:, 1])))
 
 # test link hypothesis
-experiments["results"]["links"] = [ht.evidence_markov_matrix(n_states, transition_counts, hyp_links * k,
-    smoothing=1) for k in ks]
+experiments["results"]["links"] = list(ht.evidence_markov_matrix_sweep(n_states, transition_counts, hyp_links, ks,
+    smoothing=1))
 
 # test cosine hypothesis
-e_cos = [ht.evidence_markov_matrix(n_states, transition_counts, hyp_cos * k,
-    smoothing=1) for k in ks]
+e_cos = list(ht.evidence_markov_matrix_sweep(n_states, transition_counts, hyp_cos, ks,
+    smoothing=1))
 experiments["results"]["cos"] = e_cos
 print("e_cos:               ", e_cos)
 
 # test degree hypothesis
-e_deg = [ht.evidence_markov_matrix(n_states, transition_counts, hyp_deg * k,
-    smoothing=1) for k in ks]
+e_deg = list(ht.evidence_markov_matrix_sweep(n_states, transition_counts, hyp_deg, ks,
+    smoothing=1))
 experiments["results"]["deg"] = e_deg
 print("e_deg:               ", e_deg)
 
 # test at1 hypothesis
 with open("tmp/wikispeedia-p_gt-strict-at1.p", "rb") as f:
     p_gt = pickle.load(f)
+mtmc = PreparedMTMC(transitions, p_gt, n_states)
 
 hyp_deg_cos = np.array([hyp_deg, hyp_cos])
-e_deg_cos_at1 = [deterministic.log_ml(transitions, p_gt, hyp_deg_cos * k,
-    smoothing=1) for k in ks]
+e_deg_cos_at1 = list(mtmc.log_ml_sweep(hyp_deg_cos, ks,
+    smoothing=1))
 experiments["results"]["deg_cos_at1"] = e_deg_cos_at1
 print("e_deg_cos_at1:       ", e_deg_cos_at1)
 
@@ -74,33 +75,35 @@ print("e_deg_cos_at1:       ", e_deg_cos_at1)
 # test at2 hypothesis
 with open("tmp/wikispeedia-p_gt-strict-at2.p", "rb") as f:
     p_gt = pickle.load(f)
+mtmc = PreparedMTMC(transitions, p_gt, n_states)
 
 hyp_deg_cos = np.array([hyp_deg, hyp_cos])
-e_deg_cos_at2 = [deterministic.log_ml(transitions, p_gt, hyp_deg_cos * k,
-    smoothing=1) for k in ks]
+e_deg_cos_at2 = list(mtmc.log_ml_sweep(hyp_deg_cos, ks,
+    smoothing=1))
 experiments["results"]["deg_cos_at2"] = e_deg_cos_at2
 print("e_deg_cos_at2:       ", e_deg_cos_at2)
 
 hyp_deg_deg = np.array([hyp_deg, hyp_deg])
-experiments["results"]["deg_deg_at2"] = [deterministic.log_ml(transitions, p_gt, hyp_deg_deg * k,
-    smoothing=1) for k in ks]
+experiments["results"]["deg_deg_at2"] = list(mtmc.log_ml_sweep(hyp_deg_deg, ks,
+    smoothing=1))
 
 hyp_cos_cos = np.array([hyp_cos, hyp_cos])
-experiments["results"]["cos_cos_at2"] = [deterministic.log_ml(transitions, p_gt, hyp_cos_cos * k,
-    smoothing=1) for k in ks]
+experiments["results"]["cos_cos_at2"] = list(mtmc.log_ml_sweep(hyp_cos_cos, ks,
+    smoothing=1))
 
 hyp_cos_deg = np.array([hyp_cos, hyp_deg])
-experiments["results"]["cos_deg_at2"] = [deterministic.log_ml(transitions, p_gt, hyp_cos_deg * k,
-    smoothing=1) for k in ks]
+experiments["results"]["cos_deg_at2"] = list(mtmc.log_ml_sweep(hyp_cos_deg, ks,
+    smoothing=1))
 
 
 # test at3 hypothesis
 with open("tmp/wikispeedia-p_gt-strict-at3.p", "rb") as f:
     p_gt = pickle.load(f)
+mtmc = PreparedMTMC(transitions, p_gt, n_states)
 
 hyp_deg_cos = np.array([hyp_deg, hyp_cos])
-e_deg_cos_at3 = [deterministic.log_ml(transitions, p_gt, hyp_deg_cos * k,
-    smoothing=1) for k in ks]
+e_deg_cos_at3 = list(mtmc.log_ml_sweep(hyp_deg_cos, ks,
+    smoothing=1))
 experiments["results"]["deg_cos_at3"] = e_deg_cos_at3
 print("e_deg_cos_at3:       ", e_deg_cos_at3)
 
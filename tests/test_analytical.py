@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from trails.mtmc.ml.analytical import exact, naive, sharded
+
+
+N_STATES = 3
+N_GROUPS = 2
+SMOOTHINGS = [0, 0.5, 1, 2]
+
+
+def random_input(random_state, n_transitions=7):
+    # few states, thus, many duplicated transitions
+    transitions = random_state.randint(0, N_STATES, (n_transitions, 2))
+    group_assignment_p = random_state.dirichlet(np.ones(N_GROUPS), n_transitions)
+
+    # deterministic and impossible group assignments
+    group_assignment_p[0] = [1, 0]
+    group_assignment_p[1] = [0, 1]
+    group_assignment_p[3] = group_assignment_p[2]
+    transitions[3] = transitions[2]
+
+    alpha = random_state.rand(N_GROUPS, N_STATES, N_STATES) * 2 + 0.1
+    return transitions, group_assignment_p, alpha
+
+
+@pytest.mark.parametrize("smoothing", SMOOTHINGS)
+def test_exact_equals_naive(smoothing):
+    random_state = np.random.RandomState(0)
+    for _ in range(5):
+        transitions, group_assignment_p, alpha = random_input(random_state)
+        np.testing.assert_allclose(
+            exact.log_ml(transitions, group_assignment_p, alpha, smoothing),
+            naive.log_ml(transitions, group_assignment_p, alpha, smoothing),
+            rtol=1e-12)
+
+
+@pytest.mark.parametrize("smoothing", SMOOTHINGS)
+def test_exact_equals_naive_without_group_probabilities(smoothing):
+    random_state = np.random.RandomState(1)
+    transitions, group_assignment_p, alpha = random_input(random_state)
+
+    # a group no transition can be assigned to
+    group_assignment_p = np.hstack((group_assignment_p, np.zeros((len(transitions), 1))))
+    alpha = np.concatenate((alpha, alpha[:1]))
+    np.testing.assert_allclose(
+        exact.log_ml(transitions, group_assignment_p, alpha, smoothing),
+        naive.log_ml(transitions, group_assignment_p, alpha, smoothing),
+        rtol=1e-12)
+
+
+@pytest.mark.parametrize("smoothing", SMOOTHINGS)
+def test_sharded_equals_naive(smoothing, tmpdir):
+    random_state = np.random.RandomState(2)
+    transitions, group_assignment_p, alpha = random_input(random_state)
+    expected = naive.log_ml(transitions, group_assignment_p, alpha, smoothing)
+
+    for prefix_length in [None, 1, 3]:
+        np.testing.assert_allclose(
+            sharded.log_ml(transitions, group_assignment_p, alpha, smoothing, prefix_length=prefix_length),
+            expected, rtol=1e-12)
+
+    # resumed from checkpoints
+    checkpoint_dir = str(tmpdir)
+    for _ in range(2):
+        np.testing.assert_allclose(
+            sharded.log_ml(transitions, group_assignment_p, alpha, smoothing, checkpoint_dir=checkpoint_dir),
+            expected, rtol=1e-12)
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from trails.mtmc.ml.direct import naive, optimized
+
+
+N_STATES = 4
+N_GROUPS = 3
+
+
+def random_input(random_state, n_transitions=30):
+    transitions = random_state.randint(0, N_STATES, (n_transitions, 2))
+    group_assignment_p = random_state.dirichlet(np.ones(N_GROUPS), n_transitions)
+
+    # deterministic and impossible group assignments
+    group_assignment_p[:5] = np.eye(N_GROUPS)[random_state.randint(0, N_GROUPS, 5)]
+    group_assignment_p[5:10, 0] = 0
+    group_assignment_p[5:10] /= group_assignment_p[5:10].sum(axis=1)[:, np.newaxis]
+
+    alpha = random_state.rand(N_GROUPS, N_STATES, N_STATES) * 2
+    return transitions, group_assignment_p, alpha
+
+
+@pytest.mark.parametrize("estimator", [naive, optimized])
+def test_n_jobs_bit_identical(estimator):
+    random_state = np.random.RandomState(0)
+    transitions, group_assignment_p, alpha = random_input(random_state)
+
+    for seed in [0, 42]:
+        expected = estimator.log_ml(transitions, group_assignment_p, alpha, 1, n_samples=40, n_jobs=1, seed=seed)
+        assert np.isfinite(expected)
+        for n_jobs in [2, 3]:
+            assert estimator.log_ml(
+                transitions, group_assignment_p, alpha, 1, n_samples=40, n_jobs=n_jobs, seed=seed) == expected
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from trails.mtmc.ml.analytical import exact
+from trails.mtmc.ml.gibbs import annealed
+
+
+def toy_input():
+    # toy example (cf. exp-toy-offense.ipynb): duplicated transitions between 5 states
+    transitions = np.repeat(np.array(
+        [[0, 2]] * 2 + [[2, 4]] * 2 + [[1, 3]] * 2 + [[3, 4]] * 2 +
+        [[0, 1]] * 2 + [[1, 0]] * 2 + [[2, 0]] + [[2, 3]] + [[3, 1]] + [[3, 2]]), 3, axis=0)
+
+    # deterministic, uniform and random group assignments
+    random_state = np.random.RandomState(0)
+    group_assignment_p = np.full((len(transitions), 2), 0.5)
+    group_assignment_p[::3] = [1, 0]
+    group_assignment_p[1::5] = random_state.dirichlet(np.ones(2), len(group_assignment_p[1::5]))
+
+    # uniform and forward hypotheses
+    hyp_uniform = np.ones((5, 5)) - np.eye(5)
+    hyp_forward = np.zeros((5, 5))
+    hyp_forward[[0, 1, 2, 3], [2, 3, 4, 4]] = 1
+    hyp_forward[4] = 1
+    alpha = np.array([hyp_uniform / hyp_uniform.sum(axis=1)[:, np.newaxis],
+                      hyp_forward / hyp_forward.sum(axis=1)[:, np.newaxis]])
+    return transitions, group_assignment_p, alpha
+
+
+@pytest.mark.parametrize("k", [1, 10])
+def test_log_ml_approximates_analytical(k):
+    transitions, group_assignment_p, alpha = toy_input()
+    expected = exact.log_ml(transitions, group_assignment_p, alpha * k, smoothing=1)
+    actual = annealed.log_ml(
+        transitions, group_assignment_p, alpha * k, smoothing=1, n_chains=100, n_temperatures=100, seed=0)
+    assert abs(actual - expected) < 0.15
+
+
+def test_n_jobs_bit_identical():
+    transitions, group_assignment_p, alpha = toy_input()
+
+    for seed in [0, 42]:
+        expected = annealed.log_ml(
+            transitions, group_assignment_p, alpha, 1, n_chains=12, n_temperatures=5, block_size=4, n_jobs=1, seed=seed)
+        assert np.isfinite(expected)
+        for n_jobs in [2, 3]:
+            assert annealed.log_ml(
+                transitions, group_assignment_p, alpha, 1,
+                n_chains=12, n_temperatures=5, block_size=4, n_jobs=n_jobs, seed=seed) == expected
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from trails import hyptrails
+
+
+N_STATES = 12
+SMOOTHINGS = [0.5, 1, 2]
+
+
+def random_transitions(random_state):
+    return csr_matrix(random_state.randint(0, 4, (N_STATES, N_STATES)) * (random_state.rand(N_STATES, N_STATES) > 0.6))
+
+
+def random_hypothesis(random_state):
+    # sparse, i.e., many transitions fall on entries where the hypothesis is zero
+    hyp = random_state.rand(N_STATES, N_STATES) * (random_state.rand(N_STATES, N_STATES) > 0.7)
+    hyp[0] = 0
+    return csr_matrix(hyp)
+
+
+@pytest.mark.parametrize("smoothing", SMOOTHINGS)
+def test_evidence_markov_matrix_equals_dense(smoothing):
+    random_state = np.random.RandomState(0)
+    for _ in range(5):
+        transitions = random_transitions(random_state)
+        hyp = random_hypothesis(random_state)
+        assert csr_matrix(transitions.multiply(hyp.toarray() == 0)).nnz > 0
+
+        expected = hyptrails.evidence_markov_matrix_dense(N_STATES, transitions, hyp, smoothing)
+        np.testing.assert_allclose(
+            hyptrails.evidence_markov_matrix(N_STATES, transitions, hyp, smoothing), expected)
+        np.testing.assert_allclose(
+            hyptrails.evidence_markov_matrix(N_STATES, hyptrails.PreparedTransitions(transitions), hyp, smoothing),
+            expected)
+
+
+@pytest.mark.parametrize("smoothing", SMOOTHINGS)
+def test_evidence_markov_matrix_sweep_equals_dense(smoothing):
+    random_state = np.random.RandomState(1)
+    transitions = random_transitions(random_state)
+    hyp = random_hypothesis(random_state)
+    ks = [0, 0.5, 1, 10, 1000]
+
+    expected = [hyptrails.evidence_markov_matrix_dense(N_STATES, transitions, hyp * k, smoothing) for k in ks]
+    np.testing.assert_allclose(
+        hyptrails.evidence_markov_matrix_sweep(N_STATES, transitions, hyp, ks, smoothing), expected)
+
+
+@pytest.mark.parametrize("smoothing", SMOOTHINGS)
+def test_structured_hypotheses_equal_dense(smoothing):
+    random_state = np.random.RandomState(2)
+    transitions = random_transitions(random_state)
+    adjacency_matrix = random_state.rand(N_STATES, N_STATES) > 0.6
+    adjacency_matrix[1] = False
+    row_values = random_state.rand(N_STATES) * 3
+
+    degrees = np.maximum(adjacency_matrix.sum(axis=1), 1)[:, np.newaxis]
+    structured = [
+        (hyptrails.UniformHypothesis(N_STATES), np.full((N_STATES, N_STATES), 1 / N_STATES)),
+        (hyptrails.UniformHypothesis(N_STATES, 2.5), np.full((N_STATES, N_STATES), 2.5)),
+        (hyptrails.RowConstantHypothesis(N_STATES, row_values), np.repeat(row_values[:, np.newaxis], N_STATES, 1)),
+        (hyptrails.AdjacencyHypothesis(adjacency_matrix), adjacency_matrix / degrees),
+        (hyptrails.AdjacencyHypothesis(adjacency_matrix, row_values),
+         adjacency_matrix * row_values[:, np.newaxis] / degrees),
+    ]
+
+    for hyp, dense_hyp in structured:
+        for k in [1, 7]:
+            expected = hyptrails.evidence_markov_matrix_dense(N_STATES, transitions, dense_hyp * k, smoothing)
+            np.testing.assert_allclose(
+                hyptrails.evidence_markov_matrix(N_STATES, transitions, hyp * k, smoothing), expected)
+        np.testing.assert_allclose(
+            hyptrails.evidence_markov_matrix_sweep(N_STATES, transitions, hyp, [1, 7], smoothing),
+            [hyptrails.evidence_markov_matrix_dense(N_STATES, transitions, dense_hyp * k, smoothing) for k in [1, 7]])
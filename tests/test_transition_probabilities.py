@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from trails import transition_probabilities, utils
+
+
+N_STATES = 15
+
+
+def random_graph(random_state):
+    adjacency_matrix = (random_state.rand(N_STATES, N_STATES) > 0.7).astype(int)
+
+    # every state has a neighbor (required by the loops), a few states only have neighbors of a single class
+    adjacency_matrix[np.arange(N_STATES), (np.arange(N_STATES) + 1) % N_STATES] = 1
+    adjacency_matrix[2] = 0
+    adjacency_matrix[2, 3] = 1
+
+    # entries other than 1 are no edges
+    adjacency_matrix[4, 5] = 2
+    state_properties = random_state.choice(np.array(["red", "green", "blue"]), N_STATES)
+    return adjacency_matrix, state_properties
+
+
+def group_homo_loop(adjacency_matrix, state_properties):
+    state_classes = np.sort(np.unique(state_properties))
+    group_transition_probabilities = np.zeros([len(state_classes), N_STATES, N_STATES])
+    for state_class_index, group_matrix in enumerate(group_transition_probabilities):
+        for state, transition_probabilities in enumerate(group_matrix):
+            available_destinations = utils.available_destinations(adjacency_matrix, state)
+            filtered_destinations = [
+                d for d in available_destinations if state_classes[state_class_index] == state_properties[d]]
+            if len(filtered_destinations) == 0:
+                filtered_destinations = available_destinations
+            transition_probabilities[filtered_destinations] = 1 / len(filtered_destinations)
+    return group_transition_probabilities
+
+
+def group_homo_weighted_loop(weight, adjacency_matrix, state_properties):
+    state_classes = np.sort(np.unique(state_properties))
+    group_transition_probabilities = np.zeros([len(state_classes), N_STATES, N_STATES])
+    for state_class_index, group_matrix in enumerate(group_transition_probabilities):
+        for state, transition_probabilities in enumerate(group_matrix):
+            available_destinations = utils.available_destinations(adjacency_matrix, state)
+            weighted_destinations = np.array([
+                weight if state_classes[state_class_index] == state_properties[d] else 1
+                for d in available_destinations])
+            transition_probabilities[available_destinations] = weighted_destinations / sum(weighted_destinations)
+    return group_transition_probabilities
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_group_homo_equals_loop(sparse):
+    random_state = np.random.RandomState(0)
+    for _ in range(5):
+        adjacency_matrix, state_properties = random_graph(random_state)
+        expected = group_homo_loop(adjacency_matrix, state_properties)
+
+        actual = transition_probabilities.group_homo(
+            csr_matrix(adjacency_matrix) if sparse else adjacency_matrix, state_properties)
+        if sparse:
+            actual = np.array([matrix.toarray() for matrix in actual])
+        np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+@pytest.mark.parametrize("weight", [0.5, 1, 3, 10])
+def test_group_homo_weighted_equals_loop(sparse, weight):
+    random_state = np.random.RandomState(1)
+    for _ in range(5):
+        adjacency_matrix, state_properties = random_graph(random_state)
+        expected = group_homo_weighted_loop(weight, adjacency_matrix, state_properties)
+
+        actual = transition_probabilities.group_homo_weighted(
+            weight, csr_matrix(adjacency_matrix) if sparse else adjacency_matrix, state_properties)
+        if sparse:
+            actual = np.array([matrix.toarray() for matrix in actual])
+        np.testing.assert_array_equal(actual, expected)
@@ -19,6 +19,38 @@ def memory(walk, walker, adjacency_matrix, state_properties):
         return most_common_state_types[0][0] + 1
 
 
+def walker_lockstep(walks, walkers, adjacency_matrix, state_properties):
+    """
+    Lockstep variant of ``walker`` (cf. ``RandomWalk.walk_lockstep``),
+    i.e., ``walks`` holds the walks of all walkers as an array of shape ``(n_walkers, length)``.
+    """
+    return np.asarray(walkers)
+
+
+def memory_lockstep(walks, walkers, adjacency_matrix, state_properties):
+    """
+    Lockstep variant of ``memory``:
+    ``0`` if the two most common state properties of a walk are tied, otherwise the most common one plus ``1``.
+    Entries of walkers that already stopped (``-1``) are ignored.
+    """
+    walks = np.asarray(walks)
+    n_walks = len(walks)
+    stepped = walks >= 0
+    if not stepped.any():
+        return np.zeros(n_walks, dtype=int)
+    properties, property_index = np.unique(np.asarray(state_properties)[walks[stepped]], return_inverse=True)
+
+    # count the state properties of each walk
+    walk_index = np.broadcast_to(np.arange(n_walks)[:, np.newaxis], walks.shape)[stepped]
+    counts = np.bincount(
+        walk_index * len(properties) + property_index,
+        minlength=n_walks * len(properties)).reshape((n_walks, len(properties)))
+
+    # a single property never ties
+    top_two = np.sort(np.hstack((counts, np.zeros((n_walks, 1), dtype=int))), axis=1)[:, -2:]
+    return np.where(top_two[:, 0] == top_two[:, 1], 0, properties[counts.argmax(axis=1)] + 1)
+
+
 def random(n, walk, walker, adjacency_matrix, state_properties):
     return np.random.choice(np.arange(n))
 
@@ -47,3 +79,85 @@ def init_proxy(
 
     offsets = np.cumprod(np.append(number_of_groups_list[1:], [1])[::-1])[::-1]
     return partial(proxy, group_assignment_list, offsets)
+
+
+# Batch variants return the groups of all transitions of all walks at once.
+# The walks are given as flat arrays (cf. ``flatten_walks``), i.e.,
+# ``states[walk_offsets[w]:walk_offsets[w + 1]]`` is the walk of walker ``walkers[w]``.
+# The group of the transition into ``states[p]`` only depends on the history ``states[walk_offsets[w]:p]``.
+# contract:  states, walk_offsets, walkers, adjacency_matrix, state_properties
+
+
+def flatten_walks(walks):
+    """
+    Converts walks given as tuples ``(walker, walk)`` (cf. ``RandomWalk.walk``)
+    into the walkers, the concatenated states and the offsets of the walks.
+    """
+    walkers = [walker for walker, walk in walks]
+    lengths = [len(walk) for walker, walk in walks]
+    states = np.concatenate([np.asarray(walk, dtype=int) for walker, walk in walks] + [np.empty(0, dtype=int)])
+    walk_offsets = np.append([0], np.cumsum(lengths)).astype(int)
+    return walkers, states, walk_offsets
+
+
+def transition_walks(walk_offsets):
+    """
+    Walk index of each transition and the position of its destination state in the flat array of states.
+    Thus, both shapes are ``(n_transitions,)``.
+    """
+    lengths = np.diff(walk_offsets)
+    n_transitions = np.maximum(lengths - 1, 0)
+    walk_index = np.repeat(np.arange(len(lengths)), n_transitions)
+    first_transition = np.cumsum(n_transitions) - n_transitions
+    positions = walk_offsets[walk_index] + 1 + np.arange(n_transitions.sum()) - first_transition[walk_index]
+    return walk_index, positions
+
+
+def walker_batch(states, walk_offsets, walkers, adjacency_matrix, state_properties):
+    walk_index, _ = transition_walks(walk_offsets)
+    return np.asarray(walkers)[walk_index]
+
+
+def memory_batch(states, walk_offsets, walkers, adjacency_matrix, state_properties):
+    """
+    Batch variant of ``memory`` based on running counts of the state properties along all walks.
+    """
+    walk_index, positions = transition_walks(walk_offsets)
+    if len(positions) == 0:
+        return np.zeros(0, dtype=int)
+    properties, property_index = np.unique(np.asarray(state_properties)[states], return_inverse=True)
+
+    # running counts of the state properties, i.e., the counts of the history states[walk_offsets[w]:p]
+    # are ``running[p] - running[walk_offsets[w]]``
+    running = np.zeros((len(states) + 1, len(properties)), dtype=int)
+    running[np.arange(1, len(states) + 1), property_index] = 1
+    running = np.cumsum(running, axis=0)
+    counts = running[positions] - running[walk_offsets[walk_index]]
+
+    # a single property never ties
+    top_two = np.sort(np.hstack((counts, np.zeros((len(counts), 1), dtype=int))), axis=1)[:, -2:]
+    return np.where(top_two[:, 0] == top_two[:, 1], 0, properties[counts.argmax(axis=1)] + 1)
+
+
+def random_batch(n, states, walk_offsets, walkers, adjacency_matrix, state_properties):
+    walk_index, _ = transition_walks(walk_offsets)
+    return np.random.randint(0, n, size=len(walk_index))
+
+
+def init_random_batch(n):
+    return partial(random_batch, n)
+
+
+def proxy_batch(group_assignment_list, offsets, states, walk_offsets, walkers, adjacency_matrix, state_properties):
+    groups = [group_assignment(states, walk_offsets, walkers, adjacency_matrix, state_properties)
+              for group_assignment in group_assignment_list]
+    return sum([g * o for g, o in zip(groups, offsets)])
+
+
+def init_proxy_batch(
+        group_assignment_list,
+        number_of_groups_list):
+
+    offsets = np.cumprod(np.append(number_of_groups_list[1:], [1])[::-1])[::-1]
+    return partial(proxy_batch, group_assignment_list, offsets)
+
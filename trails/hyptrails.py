@@ -1,23 +1,348 @@
 # simple HypTrails implementation taking numpy matrices as input
 
+import copy
+from abc import ABC, abstractmethod
+
+import numpy as np
+from scipy.sparse import csr_matrix, issparse
+
 
 def evidence_markov_matrix(number_of_states, transitions, hyp, smoothing=1):
-    from scipy.special import gammaln
     """
     Evidence for a first order markov model using matrices.
     Inspired by https://github.com/sequenceanalysis/sequenceanalysis.github.io/blob/master/notebooks/part4.ipynb
     """
-    transitions_prior = transitions + hyp
-
-    evidence = 0
-    evidence += gammaln(hyp.sum(axis=1) + number_of_states*smoothing).sum()
-    evidence -= gammaln(transitions.sum(axis=1) + hyp.sum(axis=1) + number_of_states*smoothing).sum()
-    evidence += gammaln(transitions_prior.data + smoothing).sum()
-    
-    gamma_smoothing = 0
-    if smoothing > 0:
-        gamma_smoothing = (len(transitions_prior.data) - len(hyp.data)) * gamma_smoothing
-        
-    evidence -= gammaln(hyp.data + smoothing).sum() + gamma_smoothing
-    
+    return evidence_markov_matrix_rows(number_of_states, transitions, hyp, smoothing).sum()
+
+
+def evidence_markov_matrix_rows(number_of_states, transitions, hyp, smoothing=1):
+    """
+    Evidence for a first order markov model split into the contributions of the individual source states.
+    Summing up the contributions yields the evidence as returned by ``evidence_markov_matrix``.
+
+    Parameters
+    ----------
+    number_of_states: int
+        Number of states.
+    transitions: csr_matrix or PreparedTransitions
+        Transition counts. Thus, the shape is ``(m,m)``.
+    hyp: csr_matrix or StructuredHypothesis
+        The hypothesis, i.e., the dirichlet prior parameters. Thus, the shape is ``(m,m)``.
+    smoothing: float
+        Adds a constant to the hypothesis during calculations.
+
+    Returns
+    -------
+    ndarray
+        The evidence per source state. Thus, the shape is ``(m,)``.
+    """
+    from scipy.special import gammaln
+
+    # only entries and rows with at least one transition contribute to the evidence,
+    # i.e., entries where the hypothesis is zero are handled exactly (``gammaln(smoothing)``)
+    # without densifying the hypothesis
+    transitions = prepare_transitions(transitions)
+    src, dst, counts, rows = transitions.src, transitions.dst, transitions.counts, transitions.rows
+    hyp_values, hyp_row_sums = hypothesis_on_transitions(hyp, src, dst)
+
+    evidence = np.zeros(number_of_states)
+    evidence[rows] += gammaln(hyp_row_sums[rows] + number_of_states*smoothing)
+    evidence[rows] -= gammaln(hyp_row_sums[rows] + transitions.row_counts[rows] + number_of_states*smoothing)
+    evidence += np.bincount(
+        src,
+        weights=gammaln(hyp_values + counts + smoothing) - gammaln(hyp_values + smoothing),
+        minlength=number_of_states)
+
+    return evidence
+
+
+def evidence_markov_matrix_rows_shared(number_of_states, transitions_list, hyp, smoothing=1):
+    """
+    Evidence per source state for several transition count matrices sharing the same hypothesis, i.e.,
+    ``np.array([evidence_markov_matrix_rows(number_of_states, t, hyp, smoothing) for t in transitions_list])``.
+
+    The hypothesis is looked up once on the union of the observed entries of all count matrices,
+    and the ``gammaln`` terms of the prior are evaluated once for each distinct entry and row.
+
+    Parameters
+    ----------
+    number_of_states: int
+        Number of states.
+    transitions_list: list
+        Transition count matrices (csr_matrix or PreparedTransitions). Each has the shape ``(m,m)``.
+    hyp: csr_matrix or StructuredHypothesis
+        The hypothesis, i.e., the dirichlet prior parameters. Thus, the shape is ``(m,m)``.
+    smoothing: float
+        Adds a constant to the hypothesis during calculations.
+
+    Returns
+    -------
+    ndarray
+        The evidence per count matrix and source state. Thus, the shape is ``(len(transitions_list),m)``.
+    """
+    from scipy.special import gammaln
+
+    transitions_list = [prepare_transitions(transitions) for transitions in transitions_list]
+    n_matrices = len(transitions_list)
+
+    # observed entries and rows of all count matrices
+    entry_matrix = np.repeat(np.arange(n_matrices), [len(t.src) for t in transitions_list])
+    src = np.concatenate([t.src for t in transitions_list] + [[]]).astype(np.int64)
+    dst = np.concatenate([t.dst for t in transitions_list] + [[]]).astype(np.int64)
+    counts = np.concatenate([t.counts for t in transitions_list] + [[]])
+    row_matrix = np.repeat(np.arange(n_matrices), [len(t.rows) for t in transitions_list])
+    rows = np.concatenate([t.rows for t in transitions_list] + [[]]).astype(np.int64)
+    row_counts = np.concatenate([t.row_counts[t.rows] for t in transitions_list] + [[]])
+
+    # prior on the distinct entries and rows
+    entries, entry_index = np.unique(src * number_of_states + dst, return_inverse=True)
+    hyp_values, hyp_row_sums = hypothesis_on_transitions(
+        hyp, entries // number_of_states, entries % number_of_states)
+    prior = hyp_values + smoothing
+    prior_row_sums = hyp_row_sums + number_of_states * smoothing
+    distinct_rows = np.unique(rows)
+    log_gamma_prior_row_sums = np.zeros(number_of_states)
+    log_gamma_prior_row_sums[distinct_rows] = gammaln(prior_row_sums[distinct_rows])
+
+    evidence = np.bincount(
+        entry_matrix * number_of_states + src,
+        weights=gammaln(prior[entry_index] + counts) - gammaln(prior)[entry_index],
+        minlength=n_matrices * number_of_states)
+    evidence += np.bincount(
+        row_matrix * number_of_states + rows,
+        weights=log_gamma_prior_row_sums[rows] - gammaln(prior_row_sums[rows] + row_counts),
+        minlength=n_matrices * number_of_states)
+
+    return evidence.reshape((n_matrices, number_of_states))
+
+
+def evidence_markov_matrix_dense(number_of_states, transitions, hyp, smoothing=1):
+    """
+    Reference implementation of ``evidence_markov_matrix`` working on dense matrices.
+    This is only feasible for small numbers of states and is meant for checking the sparse implementation.
+    """
+    from scipy.special import gammaln
+
+    transitions = transitions.toarray() if issparse(transitions) else np.asarray(transitions, dtype=float)
+    hyp = hyp.toarray() if issparse(hyp) else np.asarray(hyp, dtype=float)
+    prior = hyp + smoothing
+    transitions_row_sums = transitions.sum(axis=1)
+
+    with np.errstate(invalid="ignore"):
+        entries = gammaln(transitions + prior) - gammaln(prior)
+        rows = gammaln(prior.sum(axis=1)) - gammaln(prior.sum(axis=1) + transitions_row_sums)
+
+    # entries and rows without transitions contribute a factor of exactly one
+    return entries[transitions != 0].sum() + rows[transitions_row_sums != 0].sum()
+
+
+def evidence_markov_matrix_sweep(number_of_states, transitions, hyp, ks, smoothing=1):
+    """
+    Evidence for a first order markov model for a whole range of concentration factors ``ks``,
+    i.e., ``[evidence_markov_matrix(number_of_states, transitions, hyp * k, smoothing) for k in ks]``.
+
+    Only entries with at least one transition and rows with at least one transition
+    contribute to the evidence; all other terms cancel out.
+    Thus, the hypothesis is looked up once on the sparsity pattern of the transitions
+    and the ``gammaln`` terms for all ``k`` are evaluated as one ``(n_k, nnz)`` batch.
+
+    Parameters
+    ----------
+    number_of_states: int
+        Number of states.
+    transitions: csr_matrix or PreparedTransitions
+        Transition counts. Thus, the shape is ``(m,m)``.
+    hyp: csr_matrix or StructuredHypothesis
+        The hypothesis, i.e., the dirichlet prior parameters for ``k = 1``.
+        Thus, the shape is ``(m,m)``.
+    ks: list
+        The concentration factors ``k``.
+    smoothing: float
+        Adds a constant to the scaled hypothesis during calculations.
+
+    Returns
+    -------
+    ndarray
+        The evidence for each ``k``. Thus, the shape is ``(n_k,)``.
+    """
+    from scipy.special import gammaln
+
+    ks = np.asarray(ks, dtype=float)[:, np.newaxis]
+
+    # transition counts and hypothesis on the sparsity pattern of the transitions
+    transitions = prepare_transitions(transitions)
+    counts, rows = transitions.counts, transitions.rows
+    row_counts = transitions.row_counts[rows]
+    hyp_values, hyp_row_sums = hypothesis_on_transitions(hyp, transitions.src, transitions.dst)
+    hyp_row_sums = hyp_row_sums[rows]
+
+    # batch of shape (n_k, nnz) and (n_k, n_rows), respectively
+    prior = ks * hyp_values + smoothing
+    prior_row_sums = ks * hyp_row_sums + number_of_states * smoothing
+
+    evidence = np.zeros(ks.shape[0])
+    evidence += gammaln(prior_row_sums).sum(axis=1)
+    evidence -= gammaln(prior_row_sums + row_counts).sum(axis=1)
+    evidence += gammaln(prior + counts).sum(axis=1)
+    evidence -= gammaln(prior).sum(axis=1)
+
     return evidence
+
+
+def hypothesis_on_transitions(hyp, src, dst):
+    """
+    Values of a hypothesis (or any csr matrix) at the given transitions as well as its row sums.
+    Returns a tuple of arrays with shapes ``(len(src),)`` and ``(m,)``.
+    """
+    if isinstance(hyp, StructuredHypothesis):
+        return hyp.values(src, dst), hyp.row_sums()
+    hyp = csr_matrix(hyp)
+    return _lookup(hyp, src, dst), np.asarray(hyp.sum(axis=1)).ravel()
+
+
+def prepare_transitions(transitions):
+    """
+    Returns the given transition counts as ``PreparedTransitions`` (if they are not already).
+    """
+    if isinstance(transitions, PreparedTransitions):
+        return transitions
+    return PreparedTransitions(transitions)
+
+
+def _lookup(matrix, rows, cols):
+    """
+    Values of a csr matrix at the given coordinates (zero where the matrix holds no entry).
+    The coordinates are matched against the sparsity pattern of the matrix via binary search.
+    """
+    matrix.sum_duplicates()
+    n_cols = matrix.shape[1]
+    keys = np.repeat(np.arange(matrix.shape[0], dtype=np.int64), np.diff(matrix.indptr)) * n_cols + matrix.indices
+    query = np.asarray(rows, dtype=np.int64) * n_cols + cols
+
+    values = np.zeros(len(query))
+    if len(keys) > 0:
+        positions = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+        found = keys[positions] == query
+        values[found] = matrix.data[positions[found]]
+    return values
+
+
+class PreparedTransitions:
+    """
+    Non-zero entries and row sums of a transition count matrix.
+    They can be passed to the evidence functions instead of the count matrix,
+    so they are only derived once when evaluating many hypotheses.
+    """
+
+    def __init__(self, transitions):
+        transitions = csr_matrix(transitions)
+        transitions.sum_duplicates()
+        src = np.repeat(np.arange(transitions.shape[0]), np.diff(transitions.indptr))
+        selected = transitions.data != 0
+
+        self.shape = transitions.shape
+        self.src = src[selected]
+        self.dst = transitions.indices[selected]
+        self.counts = transitions.data[selected]
+        self.row_counts = np.bincount(self.src, weights=self.counts, minlength=self.shape[0])
+        self.rows = np.nonzero(self.row_counts)[0]
+
+
+class StructuredHypothesis(ABC):
+    """
+    Base class for hypotheses which are defined implicitly by a few parameters
+    instead of a (dense) matrix of dirichlet prior parameters.
+    The evidence only needs the row sums and the values at the observed transitions,
+    which are derived in closed form.
+    """
+
+    def __init__(self, number_of_states):
+        self.shape = (number_of_states, number_of_states)
+
+    @abstractmethod
+    def row_sums(self):
+        """
+        Sum of the pseudo counts for each source state. Thus, the shape is ``(m,)``.
+        """
+
+    @abstractmethod
+    def values(self, src, dst):
+        """
+        Pseudo counts for the given source and destination states.
+        """
+
+    @abstractmethod
+    def scale(self, k):
+        """
+        Returns the hypothesis with all pseudo counts multiplied by ``k``.
+        """
+
+    def __mul__(self, k):
+        return self.scale(k)
+
+    def __rmul__(self, k):
+        return self.scale(k)
+
+
+class RowConstantHypothesis(StructuredHypothesis):
+    """
+    Hypothesis assigning the same pseudo count ``row_values[i]`` to every transition from state ``i``.
+    """
+
+    def __init__(self, number_of_states, row_values):
+        super().__init__(number_of_states)
+        self.row_values = np.broadcast_to(np.asarray(row_values, dtype=float), (number_of_states,))
+
+    def row_sums(self):
+        return self.row_values * self.shape[1]
+
+    def values(self, src, dst):
+        return self.row_values[src]
+
+    def scale(self, k):
+        return RowConstantHypothesis(self.shape[0], self.row_values * k)
+
+
+class UniformHypothesis(RowConstantHypothesis):
+    """
+    Hypothesis assigning the same pseudo count to every transition.
+    By default, each row sums up to one, i.e., ``value = 1 / number_of_states``.
+    """
+
+    def __init__(self, number_of_states, value=None):
+        if value is None:
+            value = 1 / number_of_states
+        super().__init__(number_of_states, value)
+        self.value = value
+
+    def scale(self, k):
+        return UniformHypothesis(self.shape[0], self.value * k)
+
+
+class AdjacencyHypothesis(StructuredHypothesis):
+    """
+    Hypothesis distributing ``row_values[i]`` uniformly over the neighbors of state ``i``
+    in the given adjacency matrix (cf. ``transition_probabilities.links``).
+    By default, each row with at least one neighbor sums up to one.
+    Only the sparsity pattern of the adjacency matrix is stored.
+    """
+
+    def __init__(self, adjacency_matrix, row_values=1):
+        adjacency_matrix = csr_matrix(adjacency_matrix, copy=True)
+        adjacency_matrix.eliminate_zeros()
+        adjacency_matrix.data[:] = 1
+        super().__init__(adjacency_matrix.shape[0])
+        self.adjacency_matrix = adjacency_matrix
+        self.degrees = np.diff(adjacency_matrix.indptr)
+        self.row_values = np.broadcast_to(np.asarray(row_values, dtype=float), (self.shape[0],))
+
+    def row_sums(self):
+        return np.where(self.degrees > 0, self.row_values, 0)
+
+    def values(self, src, dst):
+        return _lookup(self.adjacency_matrix, src, dst) * self.row_values[src] / np.maximum(self.degrees[src], 1)
+
+    def scale(self, k):
+        scaled = copy.copy(self)
+        scaled.row_values = self.row_values * k
+        return scaled
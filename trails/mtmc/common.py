@@ -1,10 +1,9 @@
 import numpy as np
 import scipy.misc
 import scipy.special
-import scipy.stats as stats
 from scipy.sparse import csr_matrix
-import math
-from sklearn.utils.extmath import cartesian
+import os
+import trails.hyptrails as hyptrails
 
 
 def calc_transition_counts(
@@ -83,50 +82,267 @@ def calc_transition_counts_ascsr(
     Notes
     -----
     We assume that groups as well as states states are indexed starting at ``0``.
+    The transitions are sorted by ``(group, source_state, destination_state)`` once
+    and the csr matrices of all groups are sliced from the sorted result,
+    i.e., the runtime is ``O(n log n)`` independent of the number of groups.
 
     """
+    transitions = np.asarray(transitions, dtype=np.int64).reshape((-1, 2))
+    group_assignments = np.asarray(group_assignments, dtype=np.int64).ravel()
+
+    # ignore transitions which are not assigned to any of the groups
+    selected = (group_assignments >= 0) & (group_assignments < n_groups)
+
+    # count unique (group, src, dst) triples in a single pass
+    keys = (group_assignments[selected] * n_states + transitions[selected, 0]) * n_states + transitions[selected, 1]
+    keys, key_counts = np.unique(keys, return_counts=True)
+    groups_src, dst = keys // n_states, keys % n_states
+
+    # row pointers of all groups at once
+    indptr = np.bincount(groups_src, minlength=n_groups * n_states).reshape((n_groups, n_states))
+    indptr = np.hstack((np.zeros((n_groups, 1), dtype=np.int64), np.cumsum(indptr, axis=1)))
+    offsets = np.searchsorted(groups_src, np.arange(n_groups + 1) * n_states)
+
     counts = np.empty(n_groups, dtype=np.object)
     for g in range(n_groups):
-        selected = transitions[group_assignments == g, :]
+        group_entries = slice(offsets[g], offsets[g + 1])
         counts[g] = csr_matrix(
-            (np.ones(selected.shape[0]), (selected[:, 0], selected[:, 1])),
+            (key_counts[group_entries].astype(float), dst[group_entries], indptr[g]),
             shape=(n_states, n_states))
     return counts
 
 
+def calc_deterministic_mask(
+        group_assignment_p: np.ndarray) \
+        -> np.ndarray:
+    """
+    Marks transitions which are assigned to a single group with certainty,
+    i.e., whose group assignment probabilities are one-hot.
+    Thus, the shape is ``(n,)``.
+    """
+    return (np.asarray(group_assignment_p) != 0).sum(axis=1) == 1
+
+
+def sample_group_assignments(
+        group_assignment_p: np.ndarray,
+        n_samples: int,
+        random_state=np.random) \
+        -> np.ndarray:
+    """
+    Samples group assignments for all transitions at once
+    by inverse transform sampling against the cumulative group assignment probabilities.
+
+    Parameters
+    ----------
+    group_assignment_p: ndarray
+        Group assignment probabilities, i.e.,
+        for each transition it holds a probability distribution over groups.
+        Thus, the shape is ``(n,g)``,
+        where ``n`` is the number of transitions and ``g`` is the number of groups.
+    n_samples: int
+        Number of group assignments to draw for each transition.
+    random_state: RandomState
+        Source of randomness.
+        (Default: ``np.random``)
+
+    Returns
+    -------
+    ndarray
+        The sampled group assignments. Thus, the shape is ``(n_samples,n)``.
+    """
+    cdf = np.cumsum(group_assignment_p, axis=1, dtype=float)
+    cdf /= cdf[:, -1:]
+
+    # the number of cumulative probabilities below a uniform draw is the sampled group;
+    # rounding errors must not select trailing groups with zero probability
+    last_group = group_assignment_p.shape[1] - 1 - np.argmax(group_assignment_p[:, ::-1] > 0, axis=1)
+    u = random_state.random_sample((n_samples, cdf.shape[0], 1))
+    return np.minimum((u >= cdf).sum(axis=2), last_group)
+
+
+def draw_samples(
+        f_samples,
+        n_samples: int,
+        block_size: int=1,
+        n_jobs: int=1,
+        seed: int=None) \
+        -> np.ndarray:
+    """
+    Draws independent samples in blocks, optionally distributed over a process pool.
+
+    Each block is drawn with its own ``RandomState`` whose seed is derived from ``seed``
+    and the index of the block. Thus, the samples only depend on ``seed`` and ``block_size``,
+    i.e., they are identical for any number of jobs.
+
+    Parameters
+    ----------
+    f_samples: callable
+        Called as ``f_samples(n, random_state)`` and returns ``n`` samples as an ndarray.
+        Needs to be picklable if ``n_jobs != 1`` (e.g., a ``partial`` of a module level function).
+    n_samples: int
+        Number of samples.
+    block_size: int
+        Number of samples per block.
+        (Default: 1)
+    n_jobs: int
+        Number of processes. ``-1`` uses all available cores.
+        (Default: 1)
+    seed: int
+        Seed from which the seeds of the blocks are derived.
+        If ``None``, they are drawn from ``np.random``.
+        (Default: None)
+
+    Returns
+    -------
+    ndarray
+        The samples in the order of the blocks. Thus, the shape is ``(n_samples,)``.
+    """
+    block_sizes = [min(block_size, n_samples - start) for start in range(0, n_samples, block_size)]
+    random_state = np.random if seed is None else np.random.RandomState(seed)
+    block_seeds = random_state.randint(0, 2 ** 31 - 1, size=len(block_sizes))
+
+    if n_jobs == 1 or len(block_sizes) <= 1:
+        blocks = [_draw_block(f_samples, n, block_seed) for n, block_seed in zip(block_sizes, block_seeds)]
+    else:
+        # f_samples (and with it all inputs) is sent once per worker instead of once per block
+        from multiprocessing import Pool
+        n_jobs = os.cpu_count() if n_jobs < 0 else n_jobs
+        chunksize = max(1, len(block_sizes) // (4 * n_jobs))
+        with Pool(n_jobs, initializer=_init_worker, initargs=(f_samples,)) as pool:
+            blocks = pool.starmap(_draw_worker_block, zip(block_sizes, block_seeds), chunksize)
+
+    return np.concatenate(blocks) if len(blocks) > 0 else np.empty(0)
+
+
+def _draw_block(f_samples, n, seed):
+    return f_samples(n, np.random.RandomState(seed))
+
+
+_worker_f_samples = None
+
+
+def _init_worker(f_samples):
+    global _worker_f_samples
+    _worker_f_samples = f_samples
+
+
+def _draw_worker_block(n, seed):
+    return _draw_block(_worker_f_samples, n, seed)
+
+
 def calc_mixed_hypothesis(group_assignment_p, hyp):
     """
     Calculates mixed hypotheses for probabilistic group assignments.
+
+    The mixing coefficients of all groups are the rows of ``group_assignment_p.T @ group_assignment_p``
+    normalized to sum up to one. The hypotheses are stacked as the rows of a single ``(g,m*m)`` csr matrix,
+    such that all mixtures are calculated by a single sparse matrix product.
     """
-    mixed = np.empty(hyp.shape[0], dtype=np.object)
-    for g in range(hyp.shape[0]):
-        coeff = (group_assignment_p[:, g].reshape((len(group_assignment_p), 1)) * group_assignment_p).sum(axis=0)
-        coeff /= sum(coeff)
-        mixed[g] = sum([c * csr_matrix(h) for c, h in zip(coeff, hyp)])
+    coeff = group_assignment_p.T.dot(group_assignment_p)
+    coeff /= coeff.sum(axis=1, keepdims=True)
+
+    # stack hypotheses, i.e., each row holds one flattened hypothesis
+    hyp = [csr_matrix(h).tocoo() for h in hyp]
+    shape = hyp[0].shape
+    stacked = csr_matrix(
+        (np.hstack([h.data for h in hyp]),
+         (np.repeat(np.arange(len(hyp)), [h.nnz for h in hyp]),
+          np.hstack([h.row.astype(np.int64) * shape[1] + h.col for h in hyp]))),
+        shape=(len(hyp), shape[0] * shape[1]))
+
+    # mix and unstack
+    stacked_mixed = csr_matrix(coeff).dot(stacked)
+    mixed = np.empty(stacked_mixed.shape[0], dtype=np.object)
+    for g in range(stacked_mixed.shape[0]):
+        entries = slice(stacked_mixed.indptr[g], stacked_mixed.indptr[g + 1])
+        keys = stacked_mixed.indices[entries].astype(np.int64)
+        src, dst = keys // shape[1], keys % shape[1]
+        mixed[g] = csr_matrix((stacked_mixed.data[entries], (src, dst)), shape=shape)
     return mixed
 
 
 def calc_cartesian_group_assignment_p(group_assignment_p_list):
-    cart = np.array(
-        [[
-           np.prod(values)
-           for values in cartesian(line)]
-         for line in zip(*group_assignment_p_list)])
+    """
+    Group assignment probabilities of the cartesian product of several group dimensions,
+    assuming independent group dimensions.
+    The groups are ordered like ``sklearn.utils.extmath.cartesian``, i.e., the last dimension varies fastest.
+    Thus, the shape is ``(n,g_1*...*g_d)``.
+    """
+    cart = np.ones((len(group_assignment_p_list[0]), 1))
+    for group_assignment_p in group_assignment_p_list:
+        cart = (cart[:, :, np.newaxis] * group_assignment_p[:, np.newaxis, :]).reshape((len(cart), -1))
     return cart
 
 
 def calc_cartesian_alpha(alpha, index, n_groups_list):
+    """
+    Dirichlet prior parameters of the cartesian product of several group dimensions
+    (ordered like ``calc_cartesian_group_assignment_p``).
+    The parameters of each cartesian group are the ones of its group in dimension ``index``.
+    If ``index < 0``, ``alpha`` is a single hypothesis shared by all cartesian groups.
+
+    Returns
+    -------
+    IndexedAlpha
+        The parameters as an index map into the given hypotheses, i.e., without copying them.
+    """
+    n_cartesian_groups = int(np.prod(n_groups_list))
     if index < 0:
-        return np.array([alpha for _ in range(np.prod(n_groups_list))])
+        return IndexedAlpha([alpha], np.zeros(n_cartesian_groups, dtype=int))
     else:
-        cart = cartesian([range(n_groups) for n_groups in n_groups_list])
-        return np.array([alpha[i] for i in cart[:, index]])
+        n_faster_groups = int(np.prod(n_groups_list[index + 1:]))
+        return IndexedAlpha(alpha, (np.arange(n_cartesian_groups) // n_faster_groups) % n_groups_list[index])
+
+
+class IndexedAlpha:
+    """
+    Dirichlet prior parameters of several groups that share hypotheses,
+    i.e., an index map from groups into a (smaller) list of distinct hypotheses.
+
+    Behaves like an array of csr matrices (one for each group), so it can be passed as ``alpha`` to the estimators,
+    but each distinct hypothesis is only stored once.
+
+    Parameters
+    ----------
+    hypotheses: list
+        Distinct hypotheses, i.e., matrices of shape ``(m,m)`` or structured hypotheses.
+        Dense matrices are converted to csr matrices.
+    group_index: ndarray
+        Index of the hypothesis of each group. Thus, the shape is ``(g,)``.
+    """
+
+    def __init__(self, hypotheses, group_index):
+        self.hypotheses = np.empty(len(hypotheses), dtype=np.object)
+        for i, h in enumerate(hypotheses):
+            self.hypotheses[i] = h if isinstance(h, hyptrails.StructuredHypothesis) else csr_matrix(h)
+        self.group_index = np.asarray(group_index, dtype=int)
+        self.shape = self.group_index.shape
+
+    def __len__(self):
+        return len(self.group_index)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            key, = key
+        if np.ndim(self.group_index[key]) == 0:
+            return self.hypotheses[self.group_index[key]]
+        return IndexedAlpha(self.hypotheses, self.group_index[key])
+
+    def __iter__(self):
+        return (self.hypotheses[i] for i in self.group_index)
+
+    def __mul__(self, k):
+        return IndexedAlpha([h * k for h in self.hypotheses], self.group_index)
+
+    def __rmul__(self, k):
+        return self.__mul__(k)
 
 
 def calc_log_l(
         transitions: np.ndarray,
         group_assignment_p: np.ndarray,
-        transition_p: np.ndarray) \
+        transition_p: np.ndarray,
+        chunk_size: int=100000) \
         -> float:
     """
     The log likelihood of the MTMC model.
@@ -147,13 +363,33 @@ def calc_log_l(
         The transition probabilities between all states for each group.
         Thus the shape is ``(g,m,m)``,
         where ``g`` is the number of groups and ``m`` is the number of states.
+        Alternatively, an array of ``g`` csr matrices.
+    chunk_size: int
+        Number of transitions processed at once. Memory grows with ``chunk_size * g``.
+        (Default: 100000)
     """
 
-    return sum(
-        [scipy.misc.logsumexp(
-            [math.log(group_p) + math.log(transition_p[group, src, dst])
-             for group, group_p in enumerate(group_assignment_p[t, ]) if group_p != 0])
-         for t, (src, dst) in enumerate(transitions)])
+    log_l = 0
+    for start in range(0, transitions.shape[0], chunk_size):
+        src = transitions[start:start + chunk_size, 0]
+        dst = transitions[start:start + chunk_size, 1]
+        chunk_group_assignment_p = group_assignment_p[start:start + chunk_size]
+
+        # transition probabilities of each transition in each group, i.e., shape (chunk_size, g)
+        if len(transition_p.shape) > 1:
+            chunk_transition_p = transition_p[:, src, dst].T
+        else:
+            chunk_transition_p = np.array(
+                [np.asarray(group_transition_p[src, dst]).ravel() for group_transition_p in transition_p]).T
+
+        # groups with zero probability do not contribute
+        with np.errstate(divide="ignore"):
+            log_p = np.log(chunk_group_assignment_p) + np.log(chunk_transition_p)
+        log_p[chunk_group_assignment_p == 0] = -np.inf
+
+        log_l += scipy.misc.logsumexp(log_p, axis=1).sum()
+
+    return log_l
 
 
 def calc_log_prior(
@@ -165,31 +401,55 @@ def calc_log_prior(
     given the dirichlet parameters of the prior
     for the MTMC model.
 
+    The dirichlet log densities of all rows are calculated at once
+    as ``gammaln(sum(alpha)) - sum(gammaln(alpha)) + sum((alpha - 1) * log(p))``.
+    Entries with ``alpha == 0`` are structural zeros, i.e., they are not part of the support of their row.
+    Thus, rows without any positive alpha do not contribute,
+    and the prior is ``-inf`` if any structural zero has a positive transition probability.
+
     Parameters
     ----------
     transition_p: ndarray
         The transition probabilities between all states for each group.
         Thus the shape is ``(g,m,m)``,
         where ``g`` is the number of groups and ``m`` is the number of states.
+        Alternatively, an array of ``g`` csr matrices.
     alpha: ndarray
         The dirichlet prior parameters of the model.
         They have the same dimenstion as the transtition probabilities.
         Thus the shape is ``(g,m,m)``,
         where ``g`` is the number of groups and ``m`` is the number of states.
+        Alternatively, an array of ``g`` csr matrices.
     """
-    return sum(
-        [sum(
-            [stats.dirichlet.logpdf(src_transition_p, alpha[group, src, ])
-             for src, src_transition_p in enumerate(group_transition_p)])
-         for group, group_transition_p in enumerate(transition_p)])
-
-
-
-
-
-
-
-
-
-
 
+    # dense parameters: all groups and rows at once
+    if len(alpha.shape) > 1 and len(transition_p.shape) > 1:
+        alpha = np.asarray(alpha, dtype=float)
+        transition_p = np.asarray(transition_p, dtype=float)
+        support = alpha > 0
+        if np.any(~support & (transition_p > 0)):
+            return -np.inf
+        values, p = alpha[support], transition_p[support]
+        row_sums = alpha.sum(axis=2)
+        return scipy.special.gammaln(row_sums[row_sums > 0]).sum() + \
+            (scipy.special.xlogy(values - 1, p) - scipy.special.gammaln(values)).sum()
+
+    # sparse parameters: all rows of a group at once on the support of alpha
+    log_prior = 0
+    for group_transition_p, group_alpha in zip(transition_p, alpha):
+        group_alpha = csr_matrix(group_alpha)
+        group_alpha.eliminate_zeros()
+        group_transition_p = csr_matrix(group_transition_p)
+        group_transition_p.eliminate_zeros()
+
+        # positive transition probabilities outside of the support
+        src, dst = group_transition_p.nonzero()
+        if np.any(hyptrails.hypothesis_on_transitions(group_alpha, src, dst)[0] <= 0):
+            return -np.inf
+
+        src, dst = group_alpha.nonzero()
+        values, row_sums = hyptrails.hypothesis_on_transitions(group_alpha, src, dst)
+        p = hyptrails.hypothesis_on_transitions(group_transition_p, src, dst)[0]
+        log_prior += scipy.special.gammaln(row_sums[row_sums > 0]).sum()
+        log_prior += (scipy.special.xlogy(values - 1, p) - scipy.special.gammaln(values)).sum()
+    return log_prior
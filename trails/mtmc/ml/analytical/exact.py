@@ -0,0 +1,153 @@
+import trails.hyptrails as hyptrails
+from trails.mtmc.common import *
+from scipy.sparse import csr_matrix
+from scipy.special import gammaln
+from collections import defaultdict, OrderedDict
+import scipy.misc
+
+
+def log_ml(
+        transitions, group_assignment_p, alpha, smoothing=0):
+    """
+    Calculates the marginal likelihood of the MTMC model analytically and exactly.
+    In contrast to ``analytical.naive.log_ml`` this does not enumerate all ``n_groups ** n_transitions``
+    group assignments but exploits that transitions sharing the same source state, destination state
+    and group assignment probabilities are exchangeable:
+
+    * The marginal likelihood factorizes over source states,
+      since both the evidence and the group assignment probabilities do.
+    * For each source state, we sum over the splits of each class of exchangeable transitions into groups
+      (weighted by multinomial coefficients) instead of over individual assignments.
+    * Within a source state, destination states are only coupled via the number of transitions per group,
+      which is the state of a dynamic program over the destination states.
+
+    Thus, the runtime is polynomial in the number of transitions per source state
+    (for a fixed number of groups), which makes this feasible for heavily duplicated transitions
+    like in the toy example and a fast ground truth for the sampling estimators.
+
+    Parameters
+    ----------
+    transitions: ndarray
+        Transitions betweens states described by their source and destination state.
+        Thus, the shape is: ``(n,2)``,
+        where ``n`` is the number of states and
+        ``transitions[i,] = [source_state_i, destination_state_i]``.
+    group_assignment_p: ndarray
+        Group assignment probabilities, i.e.,
+        for each transition it holds a probability distribution over groups.
+        Thus, the shape is ``(n,g)``,
+        where ``n`` is the number of transitions and ``g`` is the number of groups.
+    alpha: ndarray
+        The dirichlet prior parameters of the model.
+        They have the same dimension as the transition probabilities.
+        Thus the shape is ``(g,m,m)``,
+        where ``g`` is the number of groups and ``m`` is the number of states.
+    smoothing: float
+        Adds a constant to alpha during calculations.
+        Usually, this is used with sparse alpha matrices, i.e.,
+        we add the "proto-prior" by setting ``smoothing=1``.
+    """
+
+    # prepare alpha
+    if len(alpha.shape) > 1:
+        alpha = np.array([csr_matrix(group_alpha) for group_alpha in alpha])
+
+    # derive variables
+    n_groups = alpha.shape[0]
+    n_states = alpha[0].shape[0]
+
+    # classes of exchangeable transitions per source and destination state
+    classes = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+    for (src, dst), p in zip(transitions, group_assignment_p):
+        classes[src][dst][tuple(p)] += 1
+
+    # prior on the observed entries and rows for each group
+    entries = np.array([(src, dst) for src in classes for dst in classes[src]], dtype=np.int64).reshape((-1, 2))
+    entry_prior = np.empty((len(entries), n_groups))
+    row_prior = np.empty((n_states, n_groups))
+    for g in range(n_groups):
+        values, row_sums = hyptrails.hypothesis_on_transitions(alpha[g], entries[:, 0], entries[:, 1])
+        entry_prior[:, g] = values + smoothing
+        row_prior[:, g] = row_sums + n_states * smoothing
+    entry_prior = dict(zip(map(tuple, entries), entry_prior))
+
+    # sum up the (independent) source states
+    evidence = 0
+    for src, src_classes in classes.items():
+
+        # distribution over the number of transitions per group (dynamic program over destination states)
+        row_distribution = {(0,) * n_groups: 0.0}
+        for dst, dst_classes in src_classes.items():
+
+            # distribution over the number of transitions per group for this destination state
+            dst_distribution = {(0,) * n_groups: 0.0}
+            for p, n in dst_classes.items():
+                dst_distribution = _convolve(dst_distribution, _splits(n, np.array(p)))
+
+            # weight with the evidence of the destination state
+            prior = entry_prior[(src, dst)]
+            dst_distribution = OrderedDict(
+                (counts, weight + _log_gamma_ratio(np.array(counts), prior))
+                for counts, weight in dst_distribution.items())
+
+            row_distribution = _convolve(row_distribution, dst_distribution)
+
+        # weight with the evidence of the source state (skipping impossible splits)
+        weights = [weight - _log_gamma_ratio(np.array(counts), row_prior[src])
+                   for counts, weight in row_distribution.items() if weight > -np.inf]
+        if len(weights) == 0:
+            return -np.inf
+        evidence += scipy.misc.logsumexp(weights)
+
+    return evidence
+
+
+def _log_gamma_ratio(counts, prior):
+    """
+    ``sum(log(Gamma(prior + counts) / Gamma(prior)))`` where entries without counts contribute nothing.
+    """
+    selected = counts > 0
+    return (gammaln(prior[selected] + counts[selected]) - gammaln(prior[selected])).sum()
+
+
+def _splits(n, p):
+    """
+    Log-probabilities of all splits of ``n`` exchangeable transitions into groups
+    given their group assignment probabilities ``p``.
+    """
+    with np.errstate(divide="ignore"):
+        log_p = np.log(p)
+
+    splits = OrderedDict()
+    for counts in _compositions(n, len(p)):
+        counts = np.array(counts)
+        if np.any((counts > 0) & (p == 0)):
+            continue
+        splits[tuple(counts)] = \
+            gammaln(n + 1) - gammaln(counts + 1).sum() + (counts[counts > 0] * log_p[counts > 0]).sum()
+    return splits
+
+
+def _compositions(n, k):
+    """
+    All tuples of ``k`` non-negative integers summing up to ``n``.
+    """
+    if k == 1:
+        yield (n,)
+        return
+    for first in range(n + 1):
+        for rest in _compositions(n - first, k - 1):
+            yield (first,) + rest
+
+
+def _convolve(distribution1, distribution2):
+    """
+    Distribution of the sum of two independent count vectors given as dictionaries of log-probabilities.
+    """
+    convolved = OrderedDict()
+    for counts1, weight1 in distribution1.items():
+        for counts2, weight2 in distribution2.items():
+            counts = tuple(c1 + c2 for c1, c2 in zip(counts1, counts2))
+            weight = weight1 + weight2
+            convolved[counts] = np.logaddexp(convolved[counts], weight) if counts in convolved else weight
+    return convolved
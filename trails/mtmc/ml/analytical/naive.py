@@ -41,13 +41,30 @@ def log_ml(
         we add the "proto-prior" by setting ``smoothing=1``.
     """
 
+    return log_ml_prefix(transitions, group_assignment_p, alpha, [], smoothing)
+
+
+def log_ml_prefix(
+        transitions, group_assignment_p, alpha, prefix, smoothing=0):
+    """
+    Calculates the part of the marginal likelihood (see ``log_ml``) that belongs to
+    all group assignments starting with the given ``prefix``,
+    i.e., the groups of the first ``len(prefix)`` transitions are fixed.
+    The marginal likelihood is the logsumexp over all prefixes of the same length.
+
+    Parameters
+    ----------
+    prefix: list
+        Groups of the first ``len(prefix)`` transitions.
+    """
+
     # derive some constants
     n_transitions = transitions.shape[0]
     n_groups = alpha.shape[0]
     n_states = alpha.shape[1]
 
-    # update alpha
-    alpha += smoothing
+    # update alpha (without modifying the given one)
+    alpha = alpha + smoothing
 
     # recursive function to go though all group assignments
     def rec(weight, transition, group_assignments):
@@ -82,5 +99,11 @@ def log_ml(
                         group_assignments)
             return scipy.misc.logsumexp([l for l in likelihoods if l <= 0])  # likelihoods can never be positive
 
-    return rec(0, 0, np.full(n_transitions, -1, dtype="int8"))
+    # fix the group assignments of the prefix
+    group_assignments = np.full(n_transitions, -1, dtype="int8")
+    group_assignments[:len(prefix)] = prefix
+    with np.errstate(divide="ignore"):
+        weight = np.log(group_assignment_p[np.arange(len(prefix)), group_assignments[:len(prefix)]]).sum()
+
+    return rec(weight, len(prefix), group_assignments)
 
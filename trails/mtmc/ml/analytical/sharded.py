@@ -0,0 +1,134 @@
+import trails.mtmc.ml.analytical.naive as naive
+from trails.mtmc.common import *
+import numpy as np
+import scipy.misc
+from functools import partial
+import hashlib
+import itertools
+import os
+
+
+# target number of shards of the default prefix length
+# (independent of the host, such that checkpoints can be resumed on any machine)
+DEFAULT_N_SHARDS = 64
+
+
+def log_ml(
+        transitions, group_assignment_p, alpha, smoothing=0,
+        prefix_length=None, n_jobs=1, checkpoint_dir=None):
+    """
+    Calculates the marginal likelihood of the MTMC model analytically like ``analytical.naive.log_ml``,
+    but splits the enumeration of all group assignments into independent shards.
+    Each shard is a fixed group assignment (prefix) of the first ``prefix_length`` transitions.
+    Shards are distributed over a process pool and their results are combined via logsumexp.
+
+    If a ``checkpoint_dir`` is given, the result of each shard is written to a file in this directory
+    as soon as it is finished. Calling this function again with the same arguments
+    only calculates the missing shards, i.e., an interrupted calculation can be resumed.
+
+    Parameters
+    ----------
+    transitions: ndarray
+        Transitions betweens states described by their source and destination state.
+        Thus, the shape is: ``(n,2)``,
+        where ``n`` is the number of states and
+        ``transitions[i,] = [source_state_i, destination_state_i]``.
+    group_assignment_p: ndarray
+        Group assignment probabilities, i.e.,
+        for each transition it holds a probability distribution over groups.
+        Thus, the shape is ``(n,g)``,
+        where ``n`` is the number of transitions and ``g`` is the number of groups.
+    alpha: ndarray
+        The dirichlet prior parameters of the model.
+        They have the same dimenstion as the transtition probabilities.
+        Thus the shape is ``(g,m,m)``,
+        where ``g`` is the number of groups and ``m`` is the number of states.
+    smoothing: float
+        Adds a constant to alpha during calculations.
+    prefix_length: int
+        Number of transitions whose group assignments define a shard.
+        If ``None``, the smallest length yielding at least ``DEFAULT_N_SHARDS`` shards is used.
+        Checkpoints are only reused for the same prefix length.
+        (Default: None)
+    n_jobs: int
+        Number of processes. ``-1`` uses all available cores.
+        (Default: 1)
+    checkpoint_dir: str
+        Directory for the results of finished shards.
+        If ``None``, no checkpoints are written.
+        (Default: None)
+    """
+
+    # derive some constants
+    n_transitions = transitions.shape[0]
+    n_groups = alpha.shape[0]
+    n_jobs = os.cpu_count() if n_jobs < 0 else n_jobs
+
+    if prefix_length is None:
+        prefix_length = 0
+        while max(n_groups, 2) ** prefix_length < DEFAULT_N_SHARDS and prefix_length < n_transitions:
+            prefix_length += 1
+
+    # shards with non-zero probability
+    prefixes = [
+        prefix for prefix in itertools.product(range(n_groups), repeat=prefix_length)
+        if all(group_assignment_p[t, group] != 0 for t, group in enumerate(prefix))]
+
+    # load finished shards
+    results = {}
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        fingerprint = _fingerprint(transitions, group_assignment_p, alpha, smoothing, prefix_length)
+        for prefix in prefixes:
+            path = _checkpoint_path(checkpoint_dir, fingerprint, prefix)
+            if os.path.exists(path):
+                with open(path) as f:
+                    results[prefix] = float(f.read())
+
+    # calculate missing shards
+    missing = [prefix for prefix in prefixes if prefix not in results]
+    f_shard = partial(naive.log_ml_prefix, transitions, group_assignment_p, alpha, smoothing=smoothing)
+
+    def finish(prefix, result):
+        results[prefix] = result
+        if checkpoint_dir is not None:
+            _write_checkpoint(_checkpoint_path(checkpoint_dir, fingerprint, prefix), result)
+
+    if n_jobs == 1:
+        for prefix in missing:
+            finish(prefix, f_shard(list(prefix)))
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = {executor.submit(f_shard, list(prefix)): prefix for prefix in missing}
+            for future in as_completed(futures):
+                finish(futures[future], future.result())
+
+    # combine shards in a fixed order
+    return scipy.misc.logsumexp([results[prefix] for prefix in prefixes if results[prefix] <= 0])
+
+
+def _fingerprint(transitions, group_assignment_p, alpha, smoothing, prefix_length):
+    """
+    Identifies the inputs of a calculation, so checkpoints of different calculations are never mixed up.
+    """
+    h = hashlib.sha1()
+    for array in [transitions, group_assignment_p, alpha]:
+        array = np.ascontiguousarray(array)
+        h.update(str((array.dtype, array.shape)).encode())
+        h.update(array.tobytes())
+    h.update(repr((float(smoothing), prefix_length)).encode())
+    return h.hexdigest()
+
+
+def _checkpoint_path(checkpoint_dir, fingerprint, prefix):
+    return os.path.join(checkpoint_dir, "%s-%s.txt" % (fingerprint, "-".join(str(g) for g in prefix)))
+
+
+def _write_checkpoint(path, result):
+    """
+    Writes the result of a shard atomically, i.e., a killed job never leaves a partial file.
+    """
+    with open(path + ".tmp", "w") as f:
+        f.write(repr(float(result)))
+    os.replace(path + ".tmp", path)
@@ -1,13 +1,50 @@
 import numpy as np
+import os
 
 from trails import hyptrails
 from scipy.sparse import csr_matrix
+from trails.mtmc.common import calc_transition_counts_ascsr, IndexedAlpha
+
+
+# minimum number of non-zero transition counts for evaluating groups concurrently
+PARALLEL_MIN_TRANSITIONS = 100000
 
 
 def log_ml_counts(
         transition_counts: np.ndarray,
         alpha: np.ndarray,
-        smoothing: float=0):
+        smoothing: float=0,
+        n_jobs: int=1):
+
+    return log_ml_counts_rows(transition_counts, alpha, smoothing, n_jobs).sum()
+
+
+def log_ml_counts_rows(
+        transition_counts: np.ndarray,
+        alpha: np.ndarray,
+        smoothing: float=0,
+        n_jobs: int=1) \
+        -> np.ndarray:
+    """
+    The marginal likelihood split into the contributions of each group and source state.
+    Summing up all contributions yields the marginal likelihood as returned by ``log_ml_counts``.
+
+    Groups (or groups sharing a hypothesis) are independent, so they can be evaluated concurrently
+    by a thread pool. This only pays off for large inputs, thus, inputs with less than
+    ``PARALLEL_MIN_TRANSITIONS`` non-zero transition counts are always evaluated serially.
+
+    Parameters
+    ----------
+    n_jobs: int
+        Number of threads. ``-1`` uses all available cores.
+        (Default: 1)
+
+    Returns
+    -------
+    ndarray
+        The contributions. Thus, the shape is ``(g,m)``,
+        where ``g`` is the number of groups and ``m`` is the number of states.
+    """
 
     # convert (numpy) arrays to array of csr_matrices if necessary
 
@@ -17,23 +54,65 @@ def log_ml_counts(
     if len(alpha.shape) > 1:
         alpha = np.array([csr_matrix(a) for a in alpha])
 
+    prepared_counts = np.empty(len(transition_counts), dtype=np.object)
+    for group, group_counts in enumerate(transition_counts):
+        prepared_counts[group] = hyptrails.prepare_transitions(group_counts)
+
     # calculate marginal likelihood using standard HypTrails
 
-    n_states = transition_counts[0].shape[0]
-    return sum(
-        [hyptrails.evidence_markov_matrix(
-            n_states,
-            group_counts,
-            alpha[group, ],
-            smoothing=smoothing)
-         for group, group_counts in enumerate(transition_counts)])
+    n_states = prepared_counts[0].shape[0]
+
+    # groups sharing a hypothesis are evaluated together
+    if isinstance(alpha, IndexedAlpha):
+        tasks = [(np.nonzero(alpha.group_index == h)[0], hyp) for h, hyp in enumerate(alpha.hypotheses)]
+        tasks = [(groups, hyp) for groups, hyp in tasks if len(groups) > 0]
+    else:
+        tasks = [(np.array([group]), alpha[group, ]) for group in range(len(prepared_counts))]
+
+    def evaluate(task):
+        groups, hyp = task
+        if len(groups) == 1:
+            return hyptrails.evidence_markov_matrix_rows(
+                n_states, prepared_counts[groups[0]], hyp, smoothing=smoothing)[np.newaxis, :]
+        return hyptrails.evidence_markov_matrix_rows_shared(
+            n_states, prepared_counts[groups], hyp, smoothing=smoothing)
+
+    n_jobs = os.cpu_count() if n_jobs < 0 else n_jobs
+    n_transitions = sum(len(group_counts.counts) for group_counts in prepared_counts)
+    if n_jobs == 1 or len(tasks) <= 1 or n_transitions < PARALLEL_MIN_TRANSITIONS:
+        results = [evaluate(task) for task in tasks]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(evaluate, tasks))
+
+    rows = np.zeros((len(prepared_counts), n_states))
+    for (groups, _), group_rows in zip(tasks, results):
+        rows[groups] = group_rows
+    return rows
 
 
 def log_ml(
         transitions: np.ndarray,
         group_assignment_p: np.ndarray,
         alpha: np.ndarray,
-        smoothing: float=0):
+        smoothing: float=0,
+        n_jobs: int=1):
+
+    return log_ml_rows(transitions, group_assignment_p, alpha, smoothing, n_jobs).sum()
+
+
+def log_ml_rows(
+        transitions: np.ndarray,
+        group_assignment_p: np.ndarray,
+        alpha: np.ndarray,
+        smoothing: float=0,
+        n_jobs: int=1) \
+        -> np.ndarray:
+    """
+    The marginal likelihood split into the contributions of each group and source state
+    (see ``log_ml_counts_rows``).
+    """
 
     # derive deterministic group assignments
     group_assignments = np.array([np.argmax(p) for p in group_assignment_p])
@@ -43,13 +122,7 @@ def log_ml(
         alpha = np.array([csr_matrix(group_alpha) for group_alpha in alpha])
 
     # calculate transition counts
-    n_groups = alpha.shape[0]
-    transition_counts = np.empty(n_groups, dtype=np.object)
-    for g in range(n_groups):
-        t_selected = transitions[group_assignments == g, ]
-        transition_counts[g] = csr_matrix(
-            (np.ones(t_selected.shape[0]), (t_selected[:, 0], t_selected[:, 1])),
-            shape=alpha[0].shape)
+    transition_counts = calc_transition_counts_ascsr(transitions, group_assignments, alpha.shape[0], alpha[0].shape[0])
 
     # calculate marginal likelihood
-    return log_ml_counts(transition_counts, alpha, smoothing)
+    return log_ml_counts_rows(transition_counts, alpha, smoothing, n_jobs)
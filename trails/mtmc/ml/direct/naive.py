@@ -1,16 +1,21 @@
-import trails.hyptrails as hyptrails
+import trails.mtmc.ml.deterministic.default as deterministic
 from trails.mtmc.common import *
+import numpy as np
 from scipy.sparse import csr_matrix
 import scipy.misc
+from functools import partial
 import math
 
 
 def log_ml(
-        transitions, group_assignment_p, alpha, smoothing=0, n_samples=100):
+        transitions, group_assignment_p, alpha, smoothing=0, n_samples=100, n_jobs=1, seed=None):
     """
     Directly samples the marginal likelihood of the MTMC model
     from the corresponding, analytically derived formula.
     In particular the group assignments are sampled.
+    Transitions with one-hot group assignment probabilities are not sampled
+    but folded into fixed base counts. If all transitions are assigned deterministically,
+    the deterministic estimator is used.
 
     This particular implementation takes advantage of the "logsumexp trick",
     which allows to work with log-probabilities hopefully reducing numeric errors.
@@ -35,12 +40,45 @@ def log_ml(
     n_samples: int
         Number of Gibbs runs.
         (Default: 100)
+    n_jobs: int
+        Number of processes the samples are distributed over. ``-1`` uses all available cores.
+        (Default: 1)
+    seed: int
+        Seed for reproducible results independent of ``n_jobs``.
+        If ``None``, the seeds of the samples are drawn from ``np.random``.
+        (Default: None)
     """
 
+    # without uncertain group assignments there is nothing to sample
+    deterministic_mask = calc_deterministic_mask(group_assignment_p)
+    if deterministic_mask.all():
+        return deterministic.log_ml(transitions, group_assignment_p, alpha, smoothing)
+
     # convert (numpy) arrays to array of csr_matrices if necessary
     if len(alpha.shape) > 1:
         alpha = np.array([csr_matrix(a) for a in alpha])
 
+    # fold transitions with deterministic group assignments into fixed base counts
+    base_counts = calc_transition_counts_ascsr(
+        transitions[deterministic_mask],
+        group_assignment_p[deterministic_mask].argmax(axis=1),
+        alpha.shape[0],
+        alpha[0].shape[0])
+    transitions = transitions[~deterministic_mask]
+    group_assignment_p = group_assignment_p[~deterministic_mask]
+
+    # run sampler
+    samples = draw_samples(
+        partial(_log_ml_samples, transitions, group_assignment_p, base_counts, alpha, smoothing),
+        n_samples,
+        n_jobs=n_jobs,
+        seed=seed)
+
+    return scipy.misc.logsumexp(samples) - math.log(n_samples)
+
+
+def _log_ml_samples(transitions, group_assignment_p, base_counts, alpha, smoothing, n_samples, random_state):
+
     # derive variables
     n_groups = alpha.shape[0]
     n_states = alpha[0].shape[0]
@@ -50,18 +88,13 @@ def log_ml(
     for i in range(n_samples):
 
         # sample group assignments
-        group_assignments = np.array([int(np.random.multinomial(1, p_g).argmax()) for p_g in group_assignment_p])
+        group_assignments = np.array(
+            [int(random_state.multinomial(1, p_g).argmax()) for p_g in group_assignment_p])
 
         # calculate transition counts
-        counts = calc_transition_counts_ascsr(transitions, group_assignments, n_groups, n_states)
+        counts = base_counts + calc_transition_counts_ascsr(transitions, group_assignments, n_groups, n_states)
 
         # calculate marginal likelihood
-        samples[i] = sum(
-            [hyptrails.evidence_markov_matrix(
-                n_states,
-                group_counts,
-                alpha[group],
-                smoothing=smoothing)
-             for group, group_counts in enumerate(counts)])
+        samples[i] = deterministic.log_ml_counts(counts, alpha, smoothing)
 
-    return scipy.misc.logsumexp(samples) - math.log(n_samples)
+    return samples
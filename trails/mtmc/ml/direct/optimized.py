@@ -1,16 +1,23 @@
-import trails.hyptrails as hyptrails
+import trails.mtmc.ml.deterministic.default as deterministic
+from trails.mtmc.prepared import PreparedStochasticMTMC
 from trails.mtmc.common import *
+import numpy as np
 from scipy.sparse import csr_matrix
 import scipy.misc
+from functools import partial
 import math
 
 
 def log_ml(
-        transitions, group_assignment_p, alpha, smoothing=0, n_samples=100):
+        transitions, group_assignment_p, alpha, smoothing=0, n_samples=100, block_size=10,
+        n_jobs=1, seed=None):
     """
     Directly samples the marginal likelihood of the MTMC model
     from the corresponding, analytically derived formula.
     In particular the group assignments are sampled.
+    Transitions with one-hot group assignment probabilities are not sampled
+    but folded into fixed base counts. If all transitions are assigned deterministically,
+    the deterministic estimator is used.
 
     This particular implementation takes advantage of the "logsumexp trick",
     which allows to work with log-probabilities hopefully reducing numeric errors.
@@ -39,40 +46,51 @@ def log_ml(
         Adds a constant to alpha during calculations.
         Usually, this is used with sparse alpha matrices, i.e.,
         we add the "proto-prior" by setting ``smoothing=1``.
+    block_size: int
+        Number of samples for which the group assignments are drawn at once.
+        Memory grows with ``block_size * n * g``.
+        Each block is seeded separately, i.e., results depend on the block size.
+        (Default: 10)
+    n_jobs: int
+        Number of processes the blocks are distributed over. ``-1`` uses all available cores.
+        (Default: 1)
+    seed: int
+        Seed for reproducible results independent of ``n_jobs``.
+        If ``None``, the seeds of the blocks are drawn from ``np.random``.
+        (Default: None)
     """
 
-    # derive variables
-    n_transitions = transitions.shape[0]
-    n_groups = alpha.shape[0]
-    n_states = alpha[0].shape[0]
-
-    # initialize samples
-    samples = np.zeros(n_samples)
+    # without uncertain group assignments there is nothing to sample
+    deterministic_mask = calc_deterministic_mask(group_assignment_p)
+    if deterministic_mask.all():
+        return deterministic.log_ml(transitions, group_assignment_p, alpha, smoothing)
 
     # prepare alpha
     if len(alpha.shape) > 1:
         alpha = np.array([csr_matrix(group_alpha) for group_alpha in alpha])
 
-    # initialize array for current group assignment
-    group_assignments = np.empty(n_transitions, dtype="int8")
+    # derive the evidence as a function of the group assignments of the stochastic transitions
+    prepared = PreparedStochasticMTMC(transitions, group_assignment_p, alpha, smoothing)
 
     # run sampler
-    for i in range(0, n_samples):
+    samples = draw_samples(
+        partial(_log_ml_samples, prepared),
+        n_samples,
+        block_size=block_size,
+        n_jobs=n_jobs,
+        seed=seed)
 
-        # sample group assignments
-        for j in range(0, n_transitions):
-            group_assignments[j] = int(np.random.multinomial(1, group_assignment_p[j, ]).argmax())
+    return scipy.misc.logsumexp(samples) - math.log(n_samples)
 
-        # calculate transition counts
-        for g in range(0, n_groups):
-            selected_transitions = transitions[group_assignments == g, :]
-            group_counts = csr_matrix(
-                (np.ones(selected_transitions.shape[0]), (selected_transitions[:, 0], selected_transitions[:, 1])),
-                (n_states, n_states))
-            samples[i] += hyptrails.evidence_markov_matrix(
-                n_states,
-                group_counts,
-                alpha[g],
-                smoothing=smoothing)
 
-    return scipy.misc.logsumexp(samples) - math.log(n_samples)
+def _log_ml_samples(prepared, n_samples, random_state):
+    """
+    Draws ``n_samples`` samples of the marginal likelihood given the group assignments.
+    Only the evidence of entries and rows touched by stochastic transitions is recalculated,
+    i.e., the cost per sample scales with the number of stochastic transitions.
+    """
+
+    # sample group assignments for all samples at once
+    group_assignments = sample_group_assignments(prepared.group_assignment_p, n_samples, random_state)
+
+    return prepared.log_evidence(*prepared.counts(group_assignments))
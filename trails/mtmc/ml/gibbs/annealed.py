@@ -0,0 +1,145 @@
+import trails.mtmc.ml.deterministic.default as deterministic
+from trails.mtmc.prepared import PreparedStochasticMTMC
+from trails.mtmc.common import *
+import numpy as np
+from scipy.sparse import csr_matrix
+import scipy.misc
+from functools import partial
+import math
+
+
+def log_ml(
+        transitions, group_assignment_p, alpha, smoothing=0,
+        n_chains=100, n_temperatures=100, n_sweeps=1, block_size=10,
+        n_jobs=1, seed=None):
+    """
+    Estimates the marginal likelihood of the MTMC model by annealed importance sampling
+    with a collapsed Gibbs sampler over the group assignments.
+
+    Each chain starts with group assignments drawn from ``group_assignment_p``
+    and is moved towards the posterior along the tempered distributions
+    ``p(z) * p(D|z) ** beta`` with ``beta`` increasing from ``0`` to ``1``.
+    The transition probabilities are integrated out,
+    thus, reassigning a transition only updates the Dirichlet-multinomial counts
+    of its entry and its row in the old and the new group.
+    Compared to the direct sampler, far fewer chains than direct samples
+    are needed for the same accuracy once there are many transitions.
+    The analytical estimators serve as ground truth on toy data.
+
+    Transitions with one-hot group assignment probabilities are never reassigned.
+    If all transitions are assigned deterministically, the deterministic estimator is used.
+
+    Parameters
+    ----------
+    transitions: ndarray
+        Transitions betweens states described by their source and destination state.
+        Thus, the shape is: ``(n,2)``,
+        where ``n`` is the number of states and
+        ``transitions[i,] = [source_state_i, destination_state_i]``.
+    group_assignment_p: ndarray
+        Group assignment probabilities, i.e.,
+        for each transition it holds a probability distribution over groups.
+        Thus, the shape is ``(n,g)``,
+        where ``n`` is the number of transitions and ``g`` is the number of groups.
+    alpha: ndarray
+        The dirichlet prior parameters of the model.
+        They have the same dimension as the transition probabilities.
+        Thus the shape is ``(g,m,m)``,
+        where ``g`` is the number of groups and ``m`` is the number of states.
+    smoothing: float
+        Adds a constant to alpha during calculations.
+        Usually, this is used with sparse alpha matrices, i.e.,
+        we add the "proto-prior" by setting ``smoothing=1``.
+    n_chains: int
+        Number of annealed importance sampling runs.
+        (Default: 100)
+    n_temperatures: int
+        Number of intermediate distributions between prior and posterior.
+        (Default: 100)
+    n_sweeps: int
+        Number of Gibbs sweeps over all stochastic transitions per temperature.
+        (Default: 1)
+    block_size: int
+        Number of chains which are run at once (vectorized).
+        Each block is seeded separately, i.e., results depend on the block size.
+        (Default: 10)
+    n_jobs: int
+        Number of processes the blocks are distributed over. ``-1`` uses all available cores.
+        (Default: 1)
+    seed: int
+        Seed for reproducible results independent of ``n_jobs``.
+        If ``None``, the seeds of the blocks are drawn from ``np.random``.
+        (Default: None)
+    """
+
+    # without uncertain group assignments there is nothing to sample
+    if calc_deterministic_mask(group_assignment_p).all():
+        return deterministic.log_ml(transitions, group_assignment_p, alpha, smoothing)
+
+    # prepare alpha
+    if len(alpha.shape) > 1:
+        alpha = np.array([csr_matrix(group_alpha) for group_alpha in alpha])
+
+    # derive the evidence as a function of the group assignments of the stochastic transitions
+    prepared = PreparedStochasticMTMC(transitions, group_assignment_p, alpha, smoothing)
+
+    # annealing schedule concentrating the temperatures close to the prior
+    betas = np.linspace(0, 1, n_temperatures + 1) ** 4
+
+    # run annealed importance sampling
+    log_weights = draw_samples(
+        partial(_log_weights, prepared, betas, n_sweeps),
+        n_chains,
+        block_size=block_size,
+        n_jobs=n_jobs,
+        seed=seed)
+
+    return scipy.misc.logsumexp(log_weights) - math.log(n_chains)
+
+
+def _log_weights(prepared, betas, n_sweeps, n_chains, random_state):
+    """
+    Runs ``n_chains`` annealed importance sampling chains at once and returns their log importance weights.
+    """
+
+    # derive variables
+    chains = np.arange(n_chains)
+    n_transitions = prepared.group_assignment_p.shape[0]
+    with np.errstate(divide="ignore"):
+        log_group_assignment_p = np.log(prepared.group_assignment_p)
+
+    # start from the prior
+    group_assignments = sample_group_assignments(prepared.group_assignment_p, n_chains, random_state)
+    entry_counts, row_counts = prepared.counts(group_assignments)
+
+    log_weights = np.zeros(n_chains)
+    for beta_previous, beta in zip(betas[:-1], betas[1:]):
+
+        # importance weights of moving to the next temperature
+        log_weights += (beta - beta_previous) * prepared.log_evidence(entry_counts, row_counts)
+
+        # collapsed Gibbs sweeps leaving the current tempered distribution invariant
+        for _ in range(n_sweeps):
+            for t in range(n_transitions):
+                entry = prepared.entry_index[t]
+                row = prepared.row_index[t]
+
+                # remove transition from its current group
+                groups = group_assignments[:, t]
+                entry_counts[chains, groups, entry] -= 1
+                row_counts[chains, groups, row] -= 1
+
+                # predictive probability of the transition in each group given all others
+                with np.errstate(divide="ignore"):
+                    log_predictive = \
+                        np.log(entry_counts[:, :, entry] + prepared.entry_prior[:, entry]) - \
+                        np.log(row_counts[:, :, row] + prepared.row_prior[:, row])
+
+                # sample new group (Gumbel-max trick) and add transition again
+                logits = log_group_assignment_p[t] + beta * log_predictive
+                groups = np.argmax(logits + random_state.gumbel(size=logits.shape), axis=1)
+                entry_counts[chains, groups, entry] += 1
+                row_counts[chains, groups, row] += 1
+                group_assignments[:, t] = groups
+
+    return log_weights
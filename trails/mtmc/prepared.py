@@ -0,0 +1,186 @@
+import numpy as np
+from scipy.special import gammaln
+
+from trails import hyptrails
+from trails.mtmc.common import calc_deterministic_mask, calc_transition_counts_ascsr, IndexedAlpha
+import trails.mtmc.ml.deterministic.default as deterministic
+
+
+class PreparedMTMC:
+    """
+    Deterministic marginal likelihood of the MTMC model for fixed transitions and group assignments.
+
+    The group assignments, the per group transition counts and their row sums are derived once.
+    Thus, evaluating any number of hypotheses (or concentration factors) only costs the evidence calculations.
+
+    Parameters
+    ----------
+    transitions: ndarray
+        Transitions betweens states described by their source and destination state.
+        Thus, the shape is: ``(n,2)``,
+        where ``n`` is the number of transitions and
+        ``transitions[i,] = [source_state_i, destination_state_i]``.
+    group_assignment_p: ndarray
+        Group assignment probabilities, i.e.,
+        for each transition it holds a probability distribution over groups.
+        Thus, the shape is ``(n,g)``,
+        where ``n`` is the number of transitions and ``g`` is the number of groups.
+        Each transition is assigned to its most probable group.
+    n_states: int
+        Number of states.
+    """
+
+    def __init__(self, transitions, group_assignment_p, n_states):
+        group_assignment_p = np.asarray(group_assignment_p)
+        group_assignment_p = group_assignment_p.reshape((len(group_assignment_p), -1))
+        group_assignments = group_assignment_p.argmax(axis=1)
+
+        self.n_states = n_states
+        self.n_groups = group_assignment_p.shape[1]
+        counts = calc_transition_counts_ascsr(transitions, group_assignments, self.n_groups, n_states)
+        self.transition_counts = np.empty(self.n_groups, dtype=np.object)
+        for g in range(self.n_groups):
+            self.transition_counts[g] = hyptrails.PreparedTransitions(counts[g])
+
+    def log_ml(self, alpha, smoothing=0):
+        """
+        The marginal likelihood for the given dirichlet prior parameters ``alpha`` (one hypothesis per group).
+        """
+        return deterministic.log_ml_counts(self.transition_counts, alpha, smoothing)
+
+    def log_ml_rows(self, alpha, smoothing=0):
+        """
+        The marginal likelihood split into the contributions of each group and source state.
+        Thus, the shape is ``(g,m)``.
+        """
+        return deterministic.log_ml_counts_rows(self.transition_counts, alpha, smoothing)
+
+    def log_ml_sweep(self, alpha, ks, smoothing=0):
+        """
+        The marginal likelihood for ``alpha * k`` for each concentration factor ``k`` in ``ks``.
+        """
+        return sum(
+            [hyptrails.evidence_markov_matrix_sweep(self.n_states, group_counts, alpha[group], ks, smoothing)
+             for group, group_counts in enumerate(self.transition_counts)])
+
+
+class PreparedStochasticMTMC:
+    """
+    Evidence of the MTMC model as a function of the group assignments of its stochastic transitions.
+
+    Transitions with one-hot group assignment probabilities are folded into fixed base counts.
+    Only entries and rows touched by the remaining (stochastic) transitions
+    depend on their group assignments, thus, the evidence of everything else is derived once.
+
+    Parameters
+    ----------
+    transitions: ndarray
+        Transitions betweens states described by their source and destination state.
+        Thus, the shape is: ``(n,2)``.
+    group_assignment_p: ndarray
+        Group assignment probabilities. Thus, the shape is ``(n,g)``.
+    alpha: ndarray
+        The dirichlet prior parameters of the model as an array of csr matrices
+        (or structured hypotheses), one for each group, or an ``IndexedAlpha``.
+    smoothing: float
+        Adds a constant to alpha during calculations.
+    """
+
+    def __init__(self, transitions, group_assignment_p, alpha, smoothing=0):
+
+        # derive variables
+        self.n_groups = alpha.shape[0]
+        self.n_states = n_states = alpha[0].shape[0]
+
+        # fold transitions with deterministic group assignments into fixed base counts
+        deterministic_mask = calc_deterministic_mask(group_assignment_p)
+        base_counts = calc_transition_counts_ascsr(
+            transitions[deterministic_mask],
+            group_assignment_p[deterministic_mask].argmax(axis=1),
+            self.n_groups,
+            n_states)
+        transitions = transitions[~deterministic_mask]
+        self.group_assignment_p = group_assignment_p[~deterministic_mask]
+
+        # entries and rows touched by the remaining (stochastic) transitions
+        entries, self.entry_index = np.unique(transitions[:, 0] * n_states + transitions[:, 1], return_inverse=True)
+        entry_src, entry_dst = entries // n_states, entries % n_states
+        rows, self.row_index = np.unique(transitions[:, 0], return_inverse=True)
+
+        # prior on the touched entries and rows for each distinct hypothesis
+        # (groups sharing a hypothesis share its prior)
+        if isinstance(alpha, IndexedAlpha):
+            hypotheses, group_index = alpha.hypotheses, alpha.group_index
+        else:
+            hypotheses, group_index = alpha, np.arange(self.n_groups)
+        entry_prior = np.empty((len(hypotheses), len(entries)))
+        row_prior = np.empty((len(hypotheses), len(rows)))
+        for h, hyp in enumerate(hypotheses):
+            values, row_sums = hyptrails.hypothesis_on_transitions(hyp, entry_src, entry_dst)
+            entry_prior[h] = values + smoothing
+            row_prior[h] = row_sums[rows] + n_states * smoothing
+        self.entry_prior = entry_prior[group_index]
+        self.row_prior = row_prior[group_index]
+        self.entry_log_gamma_prior = gammaln(entry_prior)[group_index]
+        self.row_log_gamma_prior = gammaln(row_prior)[group_index]
+
+        # base counts on the touched entries and rows for each group
+        self.entry_base = np.empty((self.n_groups, len(entries)))
+        self.row_base = np.empty((self.n_groups, len(rows)))
+        for g in range(self.n_groups):
+            values, row_sums = hyptrails.hypothesis_on_transitions(base_counts[g], entry_src, entry_dst)
+            self.entry_base[g] = values
+            self.row_base[g] = row_sums[rows]
+
+        # the evidence of all untouched entries and rows does not depend on the group assignments
+        self.fixed = deterministic.log_ml_counts(base_counts, alpha, smoothing)
+        self.fixed -= self._evidence_terms(self.entry_base, self.row_base)
+
+    def counts(self, group_assignments):
+        """
+        Counts on the touched entries and rows for a batch of group assignments of the stochastic transitions.
+
+        Parameters
+        ----------
+        group_assignments: ndarray
+            Group assignments. Thus, the shape is ``(s,n_stochastic)``.
+
+        Returns
+        -------
+        tuple
+            Entry counts and row counts with shapes ``(s,g,n_entries)`` and ``(s,g,n_rows)``.
+        """
+        n_samples = group_assignments.shape[0]
+        n_entries = self.entry_prior.shape[1]
+        n_rows = self.row_prior.shape[1]
+
+        sample_groups = np.arange(n_samples)[:, np.newaxis] * self.n_groups + group_assignments
+        entry_counts = self.entry_base + np.bincount(
+            (sample_groups * n_entries + self.entry_index).ravel(),
+            minlength=n_samples * self.n_groups * n_entries).reshape((n_samples, self.n_groups, n_entries))
+        row_counts = self.row_base + np.bincount(
+            (sample_groups * n_rows + self.row_index).ravel(),
+            minlength=n_samples * self.n_groups * n_rows).reshape((n_samples, self.n_groups, n_rows))
+        return entry_counts, row_counts
+
+    def log_evidence(self, entry_counts, row_counts):
+        """
+        The evidence for a batch of counts as returned by ``counts``. Thus, the shape is ``(s,)``.
+        """
+        return self.fixed + self._evidence_terms(entry_counts, row_counts)
+
+    def _evidence_terms(self, entry_counts, row_counts):
+        """
+        Evidence contributed by the touched entries and rows (summed over the last two axes).
+        Entries and rows without transitions contribute nothing.
+        """
+        with np.errstate(invalid="ignore"):
+            entries = np.where(
+                entry_counts > 0,
+                gammaln(entry_counts + self.entry_prior) - self.entry_log_gamma_prior,
+                0)
+            rows = np.where(
+                row_counts > 0,
+                self.row_log_gamma_prior - gammaln(self.row_prior + row_counts),
+                0)
+        return entries.sum(axis=(-2, -1)) + rows.sum(axis=(-2, -1))
@@ -8,3 +8,21 @@ def random(walker, adjacency_matrix, state_properties):
 def same_color(walker, adjacency_matrix, state_properties):
     indices = [i for i, x in enumerate(state_properties) if x == walker]
     return indices[np.random.randint(0, len(indices))]
+
+
+# Lockstep variants (cf. ``RandomWalk.walk_lockstep``) return the first states of all walkers at once.
+# contract:  walkers, adjacency_matrix, state_properties
+
+
+def random_lockstep(walkers, adjacency_matrix, state_properties):
+    return np.random.randint(0, len(state_properties), size=len(walkers))
+
+
+def same_color_lockstep(walkers, adjacency_matrix, state_properties):
+    order = np.argsort(state_properties, kind="mergesort")
+    colors, starts, counts = np.unique(np.asarray(state_properties)[order], return_index=True, return_counts=True)
+    walker_colors = np.searchsorted(colors, walkers)
+    if np.any(colors[np.minimum(walker_colors, len(colors) - 1)] != walkers):
+        raise ValueError("There is no state with the color of each walker.")
+    offsets = (np.random.random_sample(len(walkers)) * counts[walker_colors]).astype(int)
+    return order[starts[walker_colors] + offsets]
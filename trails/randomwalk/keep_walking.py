@@ -1,8 +1,10 @@
 from functools import partial
 import numpy as np
+import trails.utils as utils
 
 # Functions return true when the walker is supposed to keep walking.
 # contract:  walk, walker, adjacency_matrix, state_properties
+# (optionally graph_index, which RandomWalk binds to its utils.GraphIndex)
 
 
 def fixed(n, walk, walker, adjacency_matrix, state_properties):
@@ -19,14 +21,30 @@ def init_fixed(n):
     return partial(fixed, n)
 
 
-def stop_homo(walk, walker, adjacency_matrix, state_properties):
+def fixed_lockstep(n, walks, walkers, adjacency_matrix, state_properties):
+    """
+    Lockstep variant of ``fixed`` (cf. ``RandomWalk.walk_lockstep``),
+    i.e., ``walks`` holds the walks of all walkers as an array of shape ``(n_walkers, length)``.
+    """
+    return np.full(len(walks), walks.shape[1] <= n, dtype=bool)
+
+
+def init_fixed_lockstep(n):
+    """
+    Returns a fixed_lockstep function with a fixed "n".
+    """
+    return partial(fixed_lockstep, n)
+
+
+def stop_homo(walk, walker, adjacency_matrix, state_properties, graph_index=None):
     """
     Stops the walker when there is no state with the same properties as the walker.
     """
-    current_state = walk[-1]
-    destinations = adjacency_matrix[current_state, :]
-    reachable_properties = np.array(state_properties[destinations > 0])
-    return any(reachable_properties == walker)
+    if graph_index is not None:
+        start, end = graph_index.class_range(walk[-1], graph_index.class_index(walker))
+        return bool(end > start)
+    destinations = utils.available_destinations(adjacency_matrix, walk[-1])
+    return bool(np.any(np.asarray(state_properties)[destinations] == walker))
 
 
 def init_and(keep_walking_array):
@@ -1,20 +1,32 @@
 import numpy as np
 from functools import partial
+from scipy.sparse import csr_matrix, issparse, vstack
+import trails.hyptrails as hyptrails
 import trails.utils as utils
 
 
-def random(walk, walker, adjacency_matrix, state_properties):
+def random(walk, walker, adjacency_matrix, state_properties, graph_index=None):
     """
     Walker chooses destination randomly.
     """
-    available_destinations = utils.available_destinations(adjacency_matrix, walk[-1])
-    if len(available_destinations) is 0:
-        return None
-    return np.random.choice(available_destinations)
+    return _neighbor(utils.random_destination(adjacency_matrix, state_properties, walk[-1], graph_index))
+
+
+def _neighbor(neighbor):
+    return None if neighbor < 0 else int(neighbor)
 
 
 def matrix(transition_matrix, walk, walker, adjacency_matrix, state_properties):
     current_state = walk[-1]
+    if isinstance(transition_matrix, hyptrails.RowConstantHypothesis):
+        # uniform rows (e.g., ``transition_probabilities.random`` of sparse graphs), i.e., any state is next
+        if transition_matrix.row_values[current_state] <= 0:
+            return None
+        return np.random.randint(0, transition_matrix.shape[1])
+    if issparse(transition_matrix):
+        transition_probabilities = csr_matrix(transition_matrix[current_state, :])
+        return int(transition_probabilities.indices[np.random.choice(
+            transition_probabilities.nnz, p=transition_probabilities.data / transition_probabilities.data.sum())])
     transition_probabilities = transition_matrix[current_state]
     next_state = np.random.choice(len(transition_probabilities), p=transition_probabilities)
     return next_state
@@ -34,7 +46,7 @@ def init_grouped_matrix(f_group, grouped_transition_matrix):
     return partial(grouped_matrix, f_group, grouped_transition_matrix)
     
 
-def homo(walk, walker, adjacency_matrix, state_properties):
+def homo(walk, walker, adjacency_matrix, state_properties, graph_index=None):
     """
     Walker will always prefer own color. Chooses randomly otherwise.
     """
@@ -42,46 +54,30 @@ def homo(walk, walker, adjacency_matrix, state_properties):
     # the group
     group = walker
     
-    # the transition
-    available_destinations = utils.available_destinations(adjacency_matrix, walk[-1])
-    filtered_destinations = list(filter(lambda d: group == state_properties[d], available_destinations))
-    if len(filtered_destinations) is 0:
-        return np.random.choice(available_destinations)
-    else:
-        return np.random.choice(filtered_destinations)
+    # the transition (only neighbors of the own color if there are any)
+    return _neighbor(utils.random_destination(
+        adjacency_matrix, state_properties, walk[-1], graph_index, group, weight=np.inf))
 
 
-def homo_weighted(weight, walk, walker, adjacency_matrix, state_properties):
+def homo_weighted(weight, walk, walker, adjacency_matrix, state_properties, graph_index=None):
     """
-    Walker gives a weight to the ... TODO
+    Walker gives a weight to the destinations of her own color,
+    i.e., each of them is ``weight`` times as likely as any other destination.
     """
     
     # the group
     group = walker
 
     # the transition
-    available_destinations = utils.available_destinations(adjacency_matrix, walk[-1])
-       
-    def choose(a,b):
-        if a is b:
-            return weight
-        else:
-            return 1
-    weighted_destinations = [choose(state_properties[d], walker) for d in available_destinations]
-    
-    destination_probabilities = weighted_destinations / sum(weighted_destinations)
-    
-    random_state_index = \
-        np.random.choice(len(weighted_destinations), 1, destination_probabilities)[0]
-        
-    return available_destinations[random_state_index]
+    return _neighbor(utils.random_destination(
+        adjacency_matrix, state_properties, walk[-1], graph_index, group, weight=weight))
     
 
 def init_homo_weighted(weight):
     return partial(homo_weighted, weight)
     
 
-def memory(walk, walker, adjacency_matrix, state_properties):
+def memory(walk, walker, adjacency_matrix, state_properties, graph_index=None):
     """
     Walker looks at her history and does a majority vote on the "state" she is in.
     E.g., if most history nodes are red, she will try to go to red.
@@ -90,20 +86,81 @@ def memory(walk, walker, adjacency_matrix, state_properties):
     
     # group = transition_group_memory(walk, walker, adjacency_matrix, state_properties)
     
-    available_destinations = utils.available_destinations(adjacency_matrix, walk[-1])
-    
     from collections import Counter
     most_common_state_types = Counter([state_properties[state] for state in walk]).most_common(2)
     
-    if len(most_common_state_types) is 0 or most_common_state_types[0][1] is most_common_state_types[1][1]:
-        return np.random.choice(available_destinations)
+    if len(most_common_state_types) == 0 or \
+            (len(most_common_state_types) >= 2 and
+             most_common_state_types[0][1] == most_common_state_types[1][1]):
+        return _neighbor(utils.random_destination(adjacency_matrix, state_properties, walk[-1], graph_index))
     else:
         most_common_state_type = most_common_state_types[0][0]
-        filtered_destinations = list(filter(
-            lambda d: most_common_state_type == state_properties[d],
-            available_destinations))
-        if len(filtered_destinations) is 0:
-            return np.random.choice(available_destinations)
-        else:
-            return np.random.choice(filtered_destinations)
+        return _neighbor(utils.random_destination(
+            adjacency_matrix, state_properties, walk[-1], graph_index, most_common_state_type, weight=np.inf))
+
+
+class CumulativeTable:
+    """
+    Cumulative transition probabilities of all rows of a (grouped) transition matrix,
+    such that the next states of many walkers can be drawn at once.
+
+    The rows of all groups are stacked in csr layout, i.e., row ``group * n_states + state``
+    holds the transition probabilities of ``state`` in ``group`` and memory is linear in the number of transitions.
+    Within each row, the cumulative probabilities are shifted by the row index,
+    thus, a single ``searchsorted`` over all rows draws the next states.
+
+    Rows of a ``hyptrails.RowConstantHypothesis`` (e.g., ``transition_probabilities.random`` of sparse graphs)
+    are uniform over all states, thus, they are not stored but drawn directly.
+
+    Parameters
+    ----------
+    transition_matrix: ndarray
+        Transition matrix of shape ``(m,m)`` or grouped transition matrices of shape ``(g,m,m)``
+        (or a list of ``g`` matrices, dense, sparse or ``hyptrails.RowConstantHypothesis``).
+        Rows do not need to be normalized.
+    """
 
+    def __init__(self, transition_matrix):
+        if isinstance(transition_matrix, hyptrails.StructuredHypothesis) or issparse(transition_matrix) or \
+                np.ndim(transition_matrix[0]) == 1:
+            transition_matrix = [transition_matrix]
+
+        # uniform rows are only flagged
+        uniform = [isinstance(matrix, hyptrails.RowConstantHypothesis) for matrix in transition_matrix]
+        self.uniform_rows = np.concatenate([
+            matrix.row_values > 0 if is_uniform else np.zeros(matrix.shape[0], dtype=bool)
+            for matrix, is_uniform in zip(transition_matrix, uniform)])
+        stacked = vstack([csr_matrix(matrix.shape) if is_uniform else csr_matrix(matrix)
+                          for matrix, is_uniform in zip(transition_matrix, uniform)]).tocsr()
+        stacked.sum_duplicates()
+        stacked.eliminate_zeros()
+
+        self.n_states = stacked.shape[1]
+        self.indptr = stacked.indptr
+        self.indices = stacked.indices
+
+        # cumulative probabilities within each row plus the row index
+        rows = np.repeat(np.arange(stacked.shape[0]), np.diff(stacked.indptr))
+        row_sums = np.asarray(stacked.sum(axis=1)).ravel()
+        cumulative = np.cumsum(stacked.data / row_sums[rows])
+        row_offsets = np.append([0], cumulative)[stacked.indptr[:-1]]
+        self.keys = rows + np.clip(cumulative - row_offsets[rows], 0, 1)
+        self.keys[stacked.indptr[1:][row_sums > 0] - 1] = np.nonzero(row_sums > 0)[0] + 1
+
+    def sample(self, states, groups=0):
+        """
+        Draws the next state for each given (current) state and group.
+        Returns ``-1`` for states without any outgoing transition.
+        """
+        rows = np.asarray(groups) * self.n_states + np.asarray(states)
+        start, end = self.indptr[rows], self.indptr[rows + 1]
+        u = np.random.random_sample(rows.shape)
+        uniform_states = np.where(
+            self.uniform_rows[rows], np.minimum((u * self.n_states).astype(int), self.n_states - 1), -1)
+        if len(self.indices) == 0:
+            return uniform_states
+
+        # rounding must not move a draw out of its row
+        positions = np.searchsorted(self.keys, rows + u, side="right")
+        positions = np.minimum(np.clip(positions, start, end - 1), len(self.indices) - 1)
+        return np.where(end > start, self.indices[positions], uniform_states)
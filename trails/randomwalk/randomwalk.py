@@ -1,14 +1,28 @@
+import inspect
+from functools import partial
+
+import numpy as np
+
 import trails.randomwalk.first_state as first_state
 import trails.randomwalk.keep_walking as keep_walking
 import trails.randomwalk.next_state as next_state
+import trails.utils as utils
 
 
 class RandomWalk:
-    """Wrapper for some random walking"""
+    """
+    Wrapper for some random walking.
+    The adjacency matrix may be a numpy array or a scipy.sparse matrix.
+    
+    The walking functions receive the adjacency matrix as is.
+    Functions with a ``graph_index`` argument (e.g., the samplers in ``next_state``) additionally receive
+    a ``utils.GraphIndex`` of the graph (built once), so they draw neighbors in constant time.
+    """
     
     def __init__(self, adjacency_matrix, state_properties):
         self.adjacency_matrix = adjacency_matrix
         self.state_properties = state_properties
+        self.graph_index = utils.GraphIndex(adjacency_matrix, state_properties)
     
     def walk(self, 
             walker_properties,
@@ -16,6 +30,10 @@ class RandomWalk:
             f_keep_walking=keep_walking.init_fixed(10),
             f_first_state=first_state.random):
 
+        f_next_state = self._bind_graph_index(f_next_state)
+        f_keep_walking = self._bind_graph_index(f_keep_walking)
+        f_first_state = self._bind_graph_index(f_first_state)
+
         # initialize container for walks
         walks = [] 
 
@@ -46,3 +64,89 @@ class RandomWalk:
 
         # return walks
         return walks
+
+    def walk_lockstep(self,
+            walker_properties,
+            transition_matrix,
+            f_group=None,
+            f_keep_walking=keep_walking.init_fixed_lockstep(10),
+            f_first_state=first_state.random_lockstep):
+        """
+        Vectorized alternative to ``walk`` for walkers following a (grouped) transition matrix
+        (cf. ``next_state.init_matrix`` and ``next_state.init_grouped_matrix``).
+
+        All active walkers advance in lockstep, i.e., each step is a few array operations over all walkers
+        and their next states are drawn at once from a ``next_state.CumulativeTable``.
+        Thus, the functions passed in are the lockstep variants
+        (e.g., ``keep_walking.fixed_lockstep``, ``first_state.random_lockstep``,
+        ``group_assignment.walker_lockstep`` or ``group_assignment.memory_lockstep``)
+        which receive the walks of all walkers as an array of shape ``(n_walkers, length)``.
+        Entries of walkers that already stopped are ``-1``.
+
+        Parameters
+        ----------
+        walker_properties: list
+            The properties of each walker.
+        transition_matrix: ndarray
+            Transition matrix of shape ``(m,m)``, or grouped transition matrices of shape ``(g,m,m)``
+            if ``f_group`` is given.
+        f_group: callable
+            Returns the group of each walker, i.e., which transition matrix it follows next.
+            (Default: None)
+        f_keep_walking: callable
+            Returns for each walker whether it keeps walking.
+            (Default: ``keep_walking.init_fixed_lockstep(10)``)
+        f_first_state: callable
+            Returns the first state of each walker.
+            (Default: ``first_state.random_lockstep``)
+
+        Returns
+        -------
+        list
+            The walks as tuples ``(walker, walk)`` like ``walk``, but each walk is an ndarray of states.
+        """
+        f_group = None if f_group is None else self._bind_graph_index(f_group)
+        f_keep_walking = self._bind_graph_index(f_keep_walking)
+        f_first_state = self._bind_graph_index(f_first_state)
+
+        table = next_state.CumulativeTable(transition_matrix)
+        n_walkers = len(walker_properties)
+
+        # initialize container for walks (grows as needed)
+        walks = np.full((n_walkers, 16), -1, dtype=int)
+        walks[:, 0] = f_first_state(walker_properties, self.adjacency_matrix, self.state_properties)
+        lengths = np.ones(n_walkers, dtype=int)
+        active = np.ones(n_walkers, dtype=bool)
+
+        # walk the walks
+        length = 1
+        while True:
+            view = walks[:, :length]
+            active &= f_keep_walking(view, walker_properties, self.adjacency_matrix, self.state_properties)
+            if not active.any():
+                break
+
+            # get next states
+            groups = 0 if f_group is None else \
+                np.asarray(f_group(view, walker_properties, self.adjacency_matrix, self.state_properties))[active]
+            next_states = table.sample(walks[active, length - 1], groups)
+
+            # quit for walkers without next state
+            active[active] = next_states >= 0
+            if length == walks.shape[1]:
+                walks = np.hstack((walks, np.full(walks.shape, -1, dtype=int)))
+            walks[active, length] = next_states[next_states >= 0]
+            lengths[active] = length + 1
+            length += 1
+
+        return [(walker, walks[i, :lengths[i]]) for i, walker in enumerate(walker_properties)]
+
+    def _bind_graph_index(self, f):
+        """
+        Binds the graph index to walking functions with a ``graph_index`` argument.
+        """
+        try:
+            parameters = inspect.signature(f).parameters
+        except (TypeError, ValueError):
+            return f
+        return partial(f, graph_index=self.graph_index) if "graph_index" in parameters else f
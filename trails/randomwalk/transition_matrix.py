@@ -1,4 +1,8 @@
 import numpy as np
+from scipy.sparse import issparse
+
+import trails.group_assignment as group_assignment
+from trails.mtmc.common import calc_transition_counts_ascsr
 
 
 def transition_matrix(walks, number_of_states):
@@ -41,3 +45,32 @@ def grouped_transition_matrix(
             transition_matrix[group][src][dst] += 1
         
     return transition_matrix
+
+
+def grouped_transition_matrix_batch(
+        f_group_assignment_batch,
+        number_of_groups,
+        walks,
+        adjacency_matrix,
+        state_properties):
+    """
+    Like ``grouped_transition_matrix``, but all transitions are assigned to groups in a single call
+    of a batch group assignment function (e.g., ``group_assignment.memory_batch``)
+    and counted at once, i.e., the runtime is linear in the total length of all walks.
+    For sparse adjacency matrices, an array of csr matrices is returned.
+    """
+    
+    number_of_states = len(state_properties)
+    walkers, states, walk_offsets = group_assignment.flatten_walks(walks)
+    
+    groups = f_group_assignment_batch(states, walk_offsets, walkers, adjacency_matrix, state_properties)
+    _, positions = group_assignment.transition_walks(walk_offsets)
+    transitions = np.column_stack((states[positions - 1], states[positions]))
+    
+    if issparse(adjacency_matrix):
+        return calc_transition_counts_ascsr(transitions, groups, number_of_groups, number_of_states)
+    
+    keys = (groups * number_of_states + transitions[:, 0]) * number_of_states + transitions[:, 1]
+    return np.bincount(keys, minlength=number_of_groups * number_of_states * number_of_states).reshape(
+        (number_of_groups, number_of_states, number_of_states)).astype(float)
+
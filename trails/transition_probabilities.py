@@ -1,28 +1,40 @@
 import numpy as np
+from scipy.sparse import csr_matrix, issparse
 import trails.utils as utils
+from trails.hyptrails import UniformHypothesis
+from trails.mtmc.common import IndexedAlpha
 
 
 def expand(grouped_transition_probabilities, number_of_groups_list, group_dimension_index):
     """
     Expands a single grouped_transition_probabilities matrix to cover a cartesian product of groups.
+    
+    The result maps each group of the cartesian product to its group in dimension ``group_dimension_index``
+    (the last dimension varies fastest) without copying any matrix.
+    It supports ``len``, indexing and iteration like an array of matrices
+    and can be passed as ``alpha`` to the estimators (cf. ``trails.mtmc.common.IndexedAlpha``).
     """
-    index1 = np.append(number_of_groups_list, [1])[(group_dimension_index + 1):(len(number_of_groups_list) + 1)]
-    index2 = np.append([1], number_of_groups_list)[0:(group_dimension_index + 1)]
-#    print(index1)
-#    print(index2)
-    dim1 = np.prod(index1)
-    dim2 = np.prod(index2)
-
-    indexes = np.tile(np.repeat(np.arange(0, len(grouped_transition_probabilities)), dim1), dim2)
-#    print("Indices")
-#    print(indexes)
-#    print(len(indexes))
-
-    return np.array(grouped_transition_probabilities)[indexes]
+    n_groups = int(np.prod(number_of_groups_list))
+    n_faster_groups = int(np.prod(number_of_groups_list[(group_dimension_index + 1):]))
+    indexes = (np.arange(n_groups) // n_faster_groups) % len(grouped_transition_probabilities)
+    return IndexedAlpha(grouped_transition_probabilities, indexes)
 
 
 def random(adjacency_matrix, state_properties):
+    """
+    Uniform transition probabilities between all states.
+    
+    For sparse adjacency matrices, the result is a ``hyptrails.UniformHypothesis`` instead of a matrix,
+    which stores a single value instead of ``m*m`` entries.
+    It can be passed as hypothesis (or alpha) like a matrix
+    and walked with ``next_state.init_matrix`` or ``RandomWalk.walk_lockstep`` (in constant time per step).
+    """
     n_states = len(state_properties)      
+    
+    # all transitions are possible, thus, we do not materialize them for sparse graphs
+    if issparse(adjacency_matrix):
+        return UniformHypothesis(n_states)
+    
     transition_probabilities = np.ones([n_states, n_states])
     return utils.norm1_2d(transition_probabilities)
 
@@ -33,54 +45,71 @@ def links(adjacency_matrix, state_properties):
 
 def group_homo(adjacency_matrix, state_properties):
     
-    # initialize transition probabilities
-    state_classes = np.sort(np.unique(state_properties))
+    # classes and edges
+    state_classes, src, dst, dst_classes = _class_edges(adjacency_matrix, state_properties)
     n_states = len(state_properties)
-    group_transition_probabilities = np.zeros([len(state_classes), n_states, n_states])
     
-    for state_class_index, group_matrix in enumerate(group_transition_probabilities):
-        for state, transition_probabilities in enumerate(group_matrix):
-            
-            available_destinations = utils.available_destinations(adjacency_matrix, state)
-            filtered_destinations = list(filter(
-                lambda d: state_classes[state_class_index] == state_properties[d],
-                available_destinations))
-            
-            # if we don't have destinations of the same type, we choose randomly
-            if len(filtered_destinations) is 0:
-                filtered_destinations = available_destinations
-            
-            probability = 1 / len(filtered_destinations)
-            for d in filtered_destinations:
-                transition_probabilities[d] = probability
-                
-    return group_transition_probabilities
+    # number of all destinations and destinations of each class per state, i.e., shapes (m,) and (m,g)
+    degrees = np.bincount(src, minlength=n_states)
+    class_degrees = np.bincount(
+        src * len(state_classes) + dst_classes,
+        minlength=n_states * len(state_classes)).reshape((n_states, len(state_classes)))
+    
+    # destinations of the same type if there are any, otherwise we choose randomly
+    same_class = dst_classes == np.arange(len(state_classes))[:, np.newaxis]
+    has_same_class = class_degrees[src].T > 0
+    with np.errstate(divide="ignore"):
+        probabilities = np.where(
+            has_same_class,
+            np.where(same_class, 1 / class_degrees[src].T, 0),
+            1 / degrees[src])
+    
+    return _group_transition_probabilities(adjacency_matrix, n_states, src, dst, probabilities)
                         
 
 def group_homo_weighted(weight, adjacency_matrix, state_properties):
     
-    # initialize transition probabilities
-    state_classes = np.sort(np.unique(state_properties))
+    # classes and edges
+    state_classes, src, dst, dst_classes = _class_edges(adjacency_matrix, state_properties)
     n_states = len(state_properties)
-    group_transition_probabilities = np.zeros([len(state_classes), n_states, n_states])
-            
-    for state_class_index, group_matrix in enumerate(group_transition_probabilities):
-        for state, transition_probabilities in enumerate(group_matrix):
-            
-            available_destinations = utils.available_destinations(adjacency_matrix, state)
-            
-            def choose(a,b):
-                if a == b:
-                    return weight
-                else:
-                    return 1
-                    
-            state_class = state_classes[state_class_index]
-            
-            weighted_destinations = np.array([choose(state_class, state_properties[d]) for d in available_destinations])
-           
-            probabilities = weighted_destinations / sum(weighted_destinations)
-            
-            group_transition_probabilities[state_class_index][state][available_destinations] = probabilities
-            
-    return group_transition_probabilities
\ No newline at end of file
+    
+    # weight destinations of the same type
+    weighted_destinations = np.where(dst_classes == np.arange(len(state_classes))[:, np.newaxis], weight, 1)
+    row_sums = np.array([np.bincount(src, weights=w, minlength=n_states) for w in weighted_destinations])
+    probabilities = weighted_destinations / row_sums[:, src]
+    
+    return _group_transition_probabilities(adjacency_matrix, n_states, src, dst, probabilities)
+
+
+def _class_edges(adjacency_matrix, state_properties):
+    """
+    Sorted classes as well as source state, destination state and class index of the destination state
+    of all edges (cf. ``utils.available_destinations``) ordered by source and destination state.
+    """
+    state_classes, state_class_indices = np.unique(state_properties, return_inverse=True)
+    adjacency_matrix = csr_matrix(adjacency_matrix)
+    adjacency_matrix.sum_duplicates()
+    selected = adjacency_matrix.data == 1
+    src = np.repeat(np.arange(adjacency_matrix.shape[0]), np.diff(adjacency_matrix.indptr))[selected]
+    dst = adjacency_matrix.indices[selected]
+    return state_classes, src, dst, state_class_indices[dst]
+
+
+def _group_transition_probabilities(adjacency_matrix, n_states, src, dst, probabilities):
+    """
+    Builds grouped transition probabilities from the probabilities of all edges for each group (shape ``(g,e)``).
+    Returns a dense array of shape ``(g,m,m)`` for dense adjacency matrices,
+    otherwise an array of ``g`` csr matrices.
+    """
+    if issparse(adjacency_matrix):
+        group_transition_probabilities = np.empty(len(probabilities), dtype=np.object)
+        for group, group_probabilities in enumerate(probabilities):
+            selected = group_probabilities != 0
+            group_transition_probabilities[group] = csr_matrix(
+                (group_probabilities[selected], (src[selected], dst[selected])), shape=(n_states, n_states))
+        return group_transition_probabilities
+    
+    group_transition_probabilities = np.zeros([len(probabilities), n_states, n_states])
+    for group, group_probabilities in enumerate(probabilities):
+        group_transition_probabilities[group, src, dst] = group_probabilities
+    return group_transition_probabilities
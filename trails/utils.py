@@ -1,19 +1,163 @@
 import numpy as np
+from scipy.sparse import csr_matrix, issparse
 
 
 def norm1_2d(np_array2d):
     """
-    Normalize each "row" of a 2 dimensional numpy array using the L1 norm
+    Normalize each "row" of a 2 dimensional numpy array using the L1 norm.
+    Sparse matrices are normalized on their non-zero entries and returned as csr matrix
+    (rows without entries stay empty).
     """
+    if issparse(np_array2d):
+        normalized = csr_matrix(np_array2d, dtype=float, copy=True)
+        row_sums = np.asarray(normalized.sum(axis=1)).ravel()
+        normalized.data /= np.repeat(row_sums, np.diff(normalized.indptr))
+        return normalized
     return np_array2d / np_array2d.sum(axis=1)[:, np.newaxis]
 
 
 def norm1_3d(np_array3d):
     """
-    Normalize each "row" in each sub array in a 3 dimensional numpy array using the L1 norm
+    Normalize each "row" in each sub array in a 3 dimensional numpy array using the L1 norm.
+    An array (or list) of sparse matrices is normalized like ``norm1_2d`` and returned as array of csr matrices.
     """
+    if len(np_array3d) > 0 and issparse(np_array3d[0]):
+        normalized = np.empty(len(np_array3d), dtype=np.object)
+        for i, np_array2d in enumerate(np_array3d):
+            normalized[i] = norm1_2d(np_array2d)
+        return normalized
     return np.nan_to_num(np_array3d / np_array3d.sum(axis=2)[:, :, np.newaxis])
 
 
 def available_destinations(adjacency_matrix, state):
-    return np.where(adjacency_matrix[state,] == 1)[0]
\ No newline at end of file
+    if issparse(adjacency_matrix):
+        row = csr_matrix(adjacency_matrix[state, :])
+        row.sum_duplicates()
+        return np.sort(row.indices[row.data == 1])
+    return np.where(adjacency_matrix[state,] == 1)[0]
+
+
+class GraphIndex:
+    """
+    Neighbors of all states in csr layout, grouped by the state class of the neighbors,
+    for drawing random neighbors in constant time (cf. ``available_destinations``).
+
+    The neighbors of each state are sorted by their class, i.e., the neighbors of ``state``
+    are ``neighbors[indptr[state]:indptr[state + 1]]`` and its neighbors of class index ``c``
+    are ``neighbors[class_indptr[state * n_classes + c]:class_indptr[state * n_classes + c + 1]]``.
+    Memory is linear in the number of edges.
+
+    ``RandomWalk`` builds the index once and passes it to the walking functions that take a ``graph_index``.
+    As the index is a snapshot, modifying the adjacency matrix afterwards requires a new index.
+
+    Parameters
+    ----------
+    adjacency_matrix: ndarray or sparse matrix
+        Adjacency matrix, where ``1`` denotes an edge. Thus, the shape is ``(m,m)``.
+    state_properties: ndarray
+        The class of each state. Thus, the shape is ``(m,)``.
+    """
+
+    def __init__(self, adjacency_matrix, state_properties):
+        adjacency_matrix = csr_matrix(adjacency_matrix)
+        adjacency_matrix.sum_duplicates()
+        self.n_states = adjacency_matrix.shape[0]
+        self.classes, state_classes = np.unique(state_properties, return_inverse=True)
+        self.n_classes = len(self.classes)
+
+        # edges sorted by source state, class of the destination state and destination state
+        selected = adjacency_matrix.data == 1
+        src = np.repeat(np.arange(self.n_states), np.diff(adjacency_matrix.indptr))[selected]
+        dst = adjacency_matrix.indices[selected]
+        order = np.lexsort((dst, state_classes[dst], src))
+        src, dst = src[order], dst[order]
+
+        self.neighbors = dst
+        self.indptr = np.searchsorted(src, np.arange(self.n_states + 1))
+        self.class_indptr = np.searchsorted(
+            src * self.n_classes + state_classes[dst],
+            np.arange(self.n_states * self.n_classes + 1))
+
+    def neighbors_of(self, state):
+        return np.sort(self.neighbors[self.indptr[state]:self.indptr[state + 1]])
+
+    def class_index(self, properties):
+        """
+        Index of the given state classes in ``classes`` (``-1`` for unknown classes).
+        """
+        index = np.minimum(np.searchsorted(self.classes, properties), self.n_classes - 1)
+        return np.where(self.classes[index] == properties, index, -1)
+
+    def class_range(self, states, class_index):
+        """
+        Start and end of the neighbors of the given states with the given class indices
+        (empty for unknown classes).
+        """
+        keys = np.asarray(states) * self.n_classes + np.maximum(class_index, 0)
+        start, end = self.class_indptr[keys], self.class_indptr[keys + 1]
+        return start, np.where(np.asarray(class_index) >= 0, end, start)
+
+    def random_neighbors(self, states, class_index=None, weight=1):
+        """
+        Draws a random neighbor for each given state, ``-1`` if a state has no neighbors.
+
+        If class indices are given, neighbors of the given class are weighted by ``weight``
+        relative to all other neighbors. Thus, ``weight=np.inf`` only draws neighbors of the given class
+        as long as there is at least one.
+        Either way, a draw only needs a constant number of operations.
+        """
+        states = np.asarray(states)
+        class_bounds = None if class_index is None else self.class_range(states, class_index)
+        return _draw_neighbors(self.neighbors, self.indptr[states], self.indptr[states + 1], class_bounds, weight)
+
+
+def _draw_neighbors(neighbors, start, end, class_bounds=None, weight=1):
+    """
+    Draws a random position in ``[start, end)`` of ``neighbors`` (cf. ``GraphIndex.random_neighbors``),
+    where the positions in ``class_bounds`` (if given) are weighted by ``weight``.
+    """
+    degrees = end - start
+    u = np.random.random_sample(np.shape(start))
+    if class_bounds is None:
+        positions = start + (u * degrees).astype(int)
+    else:
+        class_start, class_end = class_bounds
+        class_degrees = class_end - class_start
+        other_degrees = degrees - class_degrees
+
+        # the class of the neighbor (same class with probability p_same), then a uniform neighbor of that class
+        with np.errstate(invalid="ignore"):
+            p_same = np.where(
+                class_degrees == 0, 0,
+                np.where(other_degrees == 0, 1,
+                         1 / (1 + other_degrees / (weight * np.maximum(class_degrees, 1)))))
+        same = np.random.random_sample(np.shape(start)) < p_same
+        same_positions = class_start + (u * class_degrees).astype(int)
+        other_offsets = (u * other_degrees).astype(int)
+        other_positions = start + other_offsets + np.where(other_offsets >= class_start - start, class_degrees, 0)
+        positions = np.where(same, same_positions, other_positions)
+    positions = np.minimum(positions, len(neighbors) - 1)
+    return np.where(degrees > 0, neighbors[positions] if len(neighbors) > 0 else -1, -1)
+
+
+def random_destination(adjacency_matrix, state_properties, state, graph_index=None, group=None, weight=1):
+    """
+    Draws a random neighbor of ``state``, ``-1`` if it has no neighbors.
+    If ``group`` is given, neighbors of this class are weighted by ``weight`` (cf. ``GraphIndex.random_neighbors``).
+
+    With a ``graph_index`` (e.g., the one built by ``RandomWalk``) the draw takes constant time.
+    Otherwise, the row of ``state`` is scanned like in ``available_destinations``.
+    Both draw from the same distribution.
+    """
+    if graph_index is not None:
+        class_index = None if group is None else graph_index.class_index(group)
+        return graph_index.random_neighbors(state, class_index, weight)
+
+    destinations = available_destinations(adjacency_matrix, state)
+    if group is None:
+        return _draw_neighbors(destinations, 0, len(destinations))
+
+    # the destinations of the group first, then all others
+    same = np.asarray(state_properties)[destinations] == group
+    destinations = np.concatenate((destinations[same], destinations[~same]))
+    return _draw_neighbors(destinations, 0, len(destinations), (0, np.count_nonzero(same)), weight)